@@ -0,0 +1,252 @@
+import argparse
+import gc
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from data_cache import RACE_COLS, RACE_MAP, apply_schema, clean_columns, load_sheet
+from export import write_xlsx
+from metrics_table import aggregate_schools, build_metrics_table, with_proportions
+from name_index import NameIndex
+from segregation import count_matrix, diversity, segregation_tables
+from views import SchoolViews
+
+WORKBOOK = "ORR ALL Grids Oct 1 2024 SY2025_Format.xlsx"
+RESULTS_FILE = "bench_results.jsonl"
+QUERIES = ["okla", "putnam", "lincoln es", "tulsa", "edmond", "clevland"]
+
+# name -> (function, largest scale it runs at)
+BENCHMARKS = {}
+
+
+def benchmark(name, max_scale=None):
+    def register(fn):
+        BENCHMARKS[name] = (fn, max_scale)
+        return fn
+    return register
+
+
+def scaled(raw, factor):
+    # factor copies of every school under new School Codes, so the copies
+    # aggregate as distinct schools
+    if factor == 1:
+        return raw
+    parts = []
+    step = int(raw["School Code"].max()) + 1
+    for i in range(factor):
+        part = raw.copy()
+        part["School Code"] = part["School Code"] + i * step
+        part["School Name"] = part["School Name"].astype(str) + f" #{i}"
+        parts.append(part)
+    out = pd.concat(parts, ignore_index=True)
+    # Categorical like a loaded sheet, not a million separate strings
+    out["School Name"] = out["School Name"].astype("category")
+    return out
+
+
+class Context:
+    # Inputs shared by the benchmarks of one scale
+    def __init__(self, raw, factor, tmp):
+        self.factor = factor
+        self.raw = scaled(raw, factor)
+        self.previous = build_metrics_table(self.raw)
+        self.grouped = self.previous.drop(columns="fingerprint")
+        # The same release with one district's rows edited
+        self.edited = self.raw.copy()
+        edited = self.edited["District Code"] == self.edited["District Code"].iloc[0]
+        self.edited.loc[edited, "His M"] += 1
+        self.index = NameIndex(self.grouped["School Name"])
+        self.views = SchoolViews(self.grouped)
+        self.tmp = tmp
+
+
+# --- load ---
+
+@benchmark("load/read_excel", max_scale=1)
+def bench_read_excel(ctx):
+    apply_schema(clean_columns(pd.read_excel(WORKBOOK)))
+
+
+@benchmark("load/arrow_cache", max_scale=1)
+def bench_load_cached(ctx):
+    load_sheet(WORKBOOK)
+
+
+# --- aggregate ---
+
+@benchmark("aggregate/groupby_agg")
+def bench_groupby_agg(ctx):
+    # The scripts' original dict-based groupby by school name
+    df = ctx.raw.copy()
+    for race, cols in RACE_MAP.items():
+        df[race] = df[cols].sum(axis=1)
+    df["total"] = df[RACE_COLS].sum(axis=1)
+    spec = {"total": "sum", "District": "first", "County": "first", **{race: "sum" for race in RACE_COLS}}
+    df.groupby("School Name").agg(spec).reset_index()
+
+
+@benchmark("aggregate/aggregate_schools")
+def bench_aggregate(ctx):
+    aggregate_schools(ctx.raw.dropna(subset=["District Code", "School Code"]))
+
+
+# The same edited release built from scratch and refreshed from the
+# previous table, fingerprints included in both
+
+@benchmark("aggregate/full_rebuild")
+def bench_full_rebuild(ctx):
+    build_metrics_table(ctx.edited)
+
+
+@benchmark("aggregate/incremental_refresh")
+def bench_incremental(ctx):
+    build_metrics_table(ctx.edited, ctx.previous)
+
+
+# --- metrics ---
+
+@benchmark("metrics/pandas_columns")
+def bench_pandas_metrics(ctx):
+    g = ctx.grouped[RACE_COLS + ["total"]].copy()
+    for col in RACE_COLS:
+        g[f"p_{col}"] = g[col] / g["total"]
+    p_cols = [f"p_{col}" for col in RACE_COLS]
+    g["simpson"] = 1 - (g[p_cols] ** 2).sum(axis=1)
+    g["entropy"] = - (g[p_cols] * np.log(g[p_cols] + 1e-10)).sum(axis=1)
+
+
+@benchmark("metrics/diversity")
+def bench_diversity(ctx):
+    diversity(count_matrix(ctx.grouped))
+
+
+@benchmark("metrics/segregation_tables")
+def bench_segregation(ctx):
+    segregation_tables(ctx.grouped)
+
+
+# --- search ---
+
+@benchmark("search/str_contains")
+def bench_str_contains(ctx):
+    names = ctx.grouped["School Name"]
+    for q in QUERIES:
+        names.loc[names.str.lower().str.contains(q, na=False)].unique()
+
+
+@benchmark("search/name_index_build")
+def bench_index_build(ctx):
+    NameIndex(ctx.grouped["School Name"])
+
+
+@benchmark("search/name_index")
+def bench_name_index(ctx):
+    for q in QUERIES:
+        ctx.index.search(q)
+
+
+# --- ranking ---
+
+@benchmark("rank/sort_values")
+def bench_sort(ctx):
+    g = ctx.grouped
+    f = g[~g["School Name"].str.contains("Epic", case=False) & (g["total"] > 70)]
+    f.sort_values("simpson", ascending=False).head(40)
+
+
+@benchmark("rank/views")
+def bench_views(ctx):
+    # Repeated query against warm views
+    ctx.views.top("simpson", 40)
+
+
+# --- export ---
+
+@benchmark("export/to_excel", max_scale=10)
+def bench_to_excel(ctx):
+    # Same columns write_xlsx writes (it adds the p_<race> shares)
+    with_proportions(ctx.grouped).to_excel(os.path.join(ctx.tmp, "bench.xlsx"), index=False)
+
+
+@benchmark("export/write_xlsx", max_scale=10)
+def bench_write_xlsx(ctx):
+    write_xlsx({"Sheet1": ctx.grouped}, os.path.join(ctx.tmp, "bench.xlsx"))
+
+
+@benchmark("export/csv")
+def bench_csv(ctx):
+    ctx.grouped.to_csv(os.path.join(ctx.tmp, "bench.csv"), index=False)
+
+
+@benchmark("export/parquet")
+def bench_parquet(ctx):
+    ctx.grouped.to_parquet(os.path.join(ctx.tmp, "bench.parquet"), index=False)
+
+
+def measure(fn, ctx, repeat):
+    # Best and median wall time over repeat runs, then one traced run for
+    # peak Python memory (tracemalloc slows code down, so it is timed apart)
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn(ctx)
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    fn(ctx)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), statistics.median(times), peak
+
+
+def _revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the diversity tool's hot paths")
+    parser.add_argument("--scales", default="1,10,100", help="comma-separated school multipliers")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help="run benchmarks whose name starts with this")
+    parser.add_argument("--output", default=RESULTS_FILE, help="JSON lines file results are appended to")
+    args = parser.parse_args(argv)
+
+    raw = load_sheet(WORKBOOK)
+    stamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+    revision = _revision()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for factor in [int(s) for s in args.scales.split(",")]:
+            ctx = Context(raw, factor, tmp)
+            for name, (fn, max_scale) in BENCHMARKS.items():
+                if args.only and not name.startswith(args.only):
+                    continue
+                if max_scale is not None and factor > max_scale:
+                    continue
+                best, median, peak = measure(fn, ctx, args.repeat)
+                row = {"time": stamp, "revision": revision, "benchmark": name, "scale": factor,
+                       "schools": len(ctx.grouped), "best_s": best, "median_s": median, "peak_mb": peak / 1e6}
+                results.append(row)
+                print(f"{name:32} x{factor:<4} best {best * 1e3:10.2f} ms  "
+                      f"median {median * 1e3:10.2f} ms  peak {peak / 1e6:8.1f} MB")
+
+    with open(args.output, "a") as f:
+        for row in results:
+            f.write(json.dumps(row) + "\n")
+    print(f"\n{len(results)} results appended to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
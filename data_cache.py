@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from profiling import stage, timed
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # no pyarrow -> read the workbook every time
+    feather = None
+
+# Cached sheets live next to the workbooks, one Arrow file per sheet
+CACHE_DIR = ".diversity_cache"
+
+# Bump this when apply_schema changes so old caches get rebuilt
+SCHEMA_VERSION = 3
+
+# --- Shared schema for every script ---
+RACE_MAP = {
+    "Hispanic": ["His M", "His F"],
+    "American Indian": ["AmInd M", "AmInd F"],
+    "Asian": ["Asian M", "Asian F"],
+    "Black": ["Black M", "Black F"],
+    "Pacific Islander": ["Pac Is M", "Pac Is F"],
+    "White": ["White M", "White F"],
+    "Multi": ["Multi M", "Multi F"]
+}
+RACE_COLS = list(RACE_MAP.keys())
+GENDER_COLS = [col for cols in RACE_MAP.values() for col in cols]
+NAME_COLS = ["County", "District", "School Name"]
+
+# Repeated on every grade row of a school, so stored once per distinct value
+CATEGORY_COLS = NAME_COLS + ["District Code", "School Level", "Grade"]
+
+# A school's count for one race, gender and grade is in the hundreds at most,
+# so school grids store counts as int16. Totals rows and state sheets run
+# past 32,767 and get the wider type; see _count_dtype.
+COUNT_DTYPES = ["int16", "int32"]
+
+
+def clean_columns(df):
+    # "His       M" -> "His M"
+    df.columns = df.columns.astype(str).str.strip().str.replace(r"\s+", " ", regex=True)
+    return df
+
+
+def _count_dtype(values, col):
+    # Smallest count type that holds every value of the column
+    low, high = values.min(), values.max()
+    for dtype in COUNT_DTYPES:
+        info = np.iinfo(dtype)
+        if pd.isna(high) or (info.min <= low and high <= info.max):
+            return dtype
+    raise ValueError(f"{col}: counts from {low} to {high} do not fit in {COUNT_DTYPES[-1]}")
+
+
+def apply_schema(df):
+    for col in GENDER_COLS:
+        if col in df.columns:
+            values = pd.to_numeric(df[col], errors="coerce").fillna(0)
+            df[col] = values.astype(_count_dtype(values, col))
+    if "School Code" in df.columns:
+        df["School Code"] = pd.to_numeric(df["School Code"], errors="coerce").astype("Int32")
+    for col in CATEGORY_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype("string").astype("category")
+    # Mixed columns like Grade (1, 2, "KGF") can't be written to Arrow as-is
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].astype("string")
+    return df
+
+
+def file_digest(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _cache_base(path, sheet_name, cache_dir):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    name = re.sub(r"[^\w.-]+", "_", f"{stem}__{sheet_name}")
+    return os.path.join(os.path.dirname(os.path.abspath(path)), cache_dir, name)
+
+
+def cache_path(path, sheet_name=0, suffix="", cache_dir=CACHE_DIR):
+    # Where derived files for a workbook sheet are kept, e.g. ".metrics.arrow"
+    return _cache_base(path, sheet_name, cache_dir) + suffix
+
+
+def read_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_meta(meta_path, meta):
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+
+
+@timed("load/arrow_cache")
+def _read_cached(arrow_path):
+    return feather.read_table(arrow_path, memory_map=True).to_pandas()
+
+
+def _parse(path, sheet_name):
+    with stage("load/read_excel") as s:
+        df = pd.read_excel(path, sheet_name=sheet_name)
+        s.rows = len(df)
+    with stage("load/clean_columns", rows=len(df)):
+        clean_columns(df)
+    with stage("load/apply_schema", rows=len(df)):
+        return apply_schema(df)
+
+
+def load_sheet(path, sheet_name=0, cache_dir=CACHE_DIR):
+    # Parse the workbook once, then memory-map the Arrow copy on later runs.
+    # The cache is reused while mtime/size match, or while the SHA-1 matches
+    # when only the mtime changed (e.g. after a fresh git checkout).
+    if feather is None:
+        return _parse(path, sheet_name)
+
+    stat = os.stat(path)
+    base = _cache_base(path, sheet_name, cache_dir)
+    arrow_path, meta_path = base + ".arrow", base + ".json"
+    meta = read_meta(meta_path)
+    digest = None
+
+    if meta and meta.get("version") == SCHEMA_VERSION and os.path.exists(arrow_path):
+        if meta["mtime"] == stat.st_mtime and meta["size"] == stat.st_size:
+            return _read_cached(arrow_path)
+        digest = file_digest(path)
+        if meta["sha1"] == digest:
+            meta.update(mtime=stat.st_mtime, size=stat.st_size)
+            write_meta(meta_path, meta)
+            return _read_cached(arrow_path)
+
+    df = _parse(path, sheet_name)
+
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    # Uncompressed so the file can be memory-mapped without inflating it
+    feather.write_feather(df, arrow_path, compression="uncompressed")
+    write_meta(meta_path, {
+        "version": SCHEMA_VERSION,
+        "source": os.path.basename(path),
+        "sheet": str(sheet_name),
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "sha1": digest or file_digest(path),
+    })
+    return df
+
+
+def source_digest(path, sheet_name=0, cache_dir=CACHE_DIR):
+    # SHA-1 of a workbook, taken from the cache metadata while it is fresh
+    meta = read_meta(_cache_base(path, sheet_name, cache_dir) + ".json")
+    stat = os.stat(path)
+    if meta and meta["mtime"] == stat.st_mtime and meta["size"] == stat.st_size:
+        return meta["sha1"]
+    return file_digest(path)
@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+
+from district_stream import (DEMOGRAPHICS_FILE, POVERTY_COLUMNS, RACE_COLUMNS, district_code,
+                             load_demographics)
+from ingest import DEMOGRAPHIC_RACES
+from name_index import normalize
+from segregation import diversity, group_codes, group_sum, grouping
+
+# Indicator name -> "District Demographic Data.xlsx" column (percent)
+INDICATORS = {
+    "poverty": "LUNCH_COUNT_FREE_REDUCED_PCT",
+    "ell": "ELL_LEP_STUDENTS_ENROLLED_K_12_PCT",
+}
+
+# Need at least this many districts (or schools) for a regression
+MIN_OBSERVATIONS = 5
+
+
+class DistrictIndicators:
+    # Poverty and ELL share of every district and year, with each district's
+    # own race mix and diversity. The join keys (year + code, year + name)
+    # are hashed into two indexes once; matching a table is one get_indexer
+    # call per key instead of a merge.
+
+    def __init__(self, path=DEMOGRAPHICS_FILE, years=None):
+        columns = list(dict.fromkeys(POVERTY_COLUMNS + RACE_COLUMNS))
+        df = load_demographics(path, columns=columns, years=years)
+        df = df.dropna(subset=["YEAR"])
+        races = pd.DataFrame({race: df[col] for race, col in DEMOGRAPHIC_RACES.items()})
+        races["Asian"] = races["Asian"].fillna(df["ENROLLMENT_ASIAN_PACIFIC_ISLANDER"])
+        complete = races.notna().all(axis=1).to_numpy()
+        _, _, simpson, entropy = diversity(races.fillna(0).to_numpy())
+
+        self.table = pd.DataFrame({
+            "year": df["YEAR"].astype(int).to_numpy(),
+            "code": df["COUNTY_DISTRICT_CODE"].map(_code_key).to_numpy(),
+            "district": df["DISTRICT_NAME"].to_numpy(),
+            **{name: df[col].to_numpy(dtype=np.float64) for name, col in INDICATORS.items()},
+            # Years that report only some races have no diversity to compare
+            "simpson": np.where(complete, simpson, np.nan),
+            "entropy": np.where(complete, entropy, np.nan),
+        })
+        self.years = np.sort(self.table["year"].unique())
+        names = self.table["district"].map(normalize, na_action="ignore")
+        self._by_code = _key_index(self.table["year"], self.table["code"])
+        self._by_name = _key_index(self.table["year"], names)
+
+    def positions(self, districts, codes=None, year=None):
+        # Row of self.table for each district in year (default: the latest),
+        # matched on code first and normalized name second; -1 if neither
+        year = self.years[-1] if year is None else year
+        n = len(districts)
+        years = np.full(n, year)
+        names = pd.Series(districts).astype(object).map(normalize, na_action="ignore")
+        found = _lookup(self._by_name, years, names)
+        if codes is not None:
+            by_code = _lookup(self._by_code, years, pd.Series(codes).astype(object).map(_code_key))
+            found = np.where(by_code >= 0, by_code, found)
+        return found
+
+    def attach(self, table, year=None, positions=None):
+        # Copy of a school (or district) table with its district's indicators;
+        # pass positions from an earlier positions() call to skip the lookup
+        if positions is None:
+            codes = table["District Code"] if "District Code" in table.columns else None
+            positions = self.positions(table["District"], codes, year)
+        out = table.copy()
+        matched = positions >= 0
+        for name in INDICATORS:
+            values = self.table[name].to_numpy()
+            out[name] = np.where(matched, values[np.maximum(positions, 0)], np.nan)
+        return out
+
+
+def _code_key(code):
+    # 1090, "001090" and "55I001" compared as the same kind of string
+    if pd.isna(code):
+        return None
+    if isinstance(code, float) and code.is_integer():
+        code = int(code)
+    return district_code(code).upper()
+
+
+def _key_index(years, keys):
+    # Hashed (year, key) index and the table row of each entry; the first
+    # row wins when a key repeats
+    index = pd.MultiIndex.from_arrays([np.asarray(years), np.asarray(keys, dtype=object)])
+    first = ~index.duplicated()
+    return index[first], np.flatnonzero(first)
+
+
+def _lookup(key_index, years, keys):
+    index, rows = key_index
+    found = index.get_indexer(pd.MultiIndex.from_arrays([years, np.asarray(keys, dtype=object)]))
+    return np.where(found >= 0, rows[found], -1)
+
+
+def batched_regression(y, X, codes, n_groups):
+    # Ordinary least squares of y on [1, X] separately within every group,
+    # from per-group sums of the normal equations: one pass over the rows,
+    # then a stacked solve. Rows with a nan anywhere are left out.
+    # Returns coef [G, 1 + k], r2 [G], n [G] (nan where n < MIN_OBSERVATIONS).
+    y = np.asarray(y, dtype=np.float64)
+    X = np.asarray(X, dtype=np.float64)
+    X = np.column_stack([np.ones(len(y)), X[:, None] if X.ndim == 1 else X])
+    ok = ~(np.isnan(y) | np.isnan(X).any(axis=1))
+    y, X, codes = y[ok], X[ok], np.asarray(codes)[ok]
+    groups = grouping(codes, n_groups)
+    k = X.shape[1]
+
+    xtx = group_sum((X[:, :, None] * X[:, None, :]).reshape(len(y), k * k), groups).reshape(n_groups, k, k)
+    xty = group_sum(X * y[:, None], groups)
+    yy = group_sum(np.c_[y, y * y], groups)
+    n = xtx[:, 0, 0]
+
+    solvable = n >= max(MIN_OBSERVATIONS, k + 1)
+    solvable[solvable] = np.linalg.matrix_rank(xtx[solvable]) == k
+    coef = np.full((n_groups, k), np.nan)
+    coef[solvable] = np.linalg.solve(xtx[solvable], xty[solvable][:, :, None])[:, :, 0]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        total_ss = yy[:, 1] - yy[:, 0] ** 2 / n
+        resid_ss = yy[:, 1] - 2 * (coef * xty).sum(axis=1) + np.einsum("gi,gij,gj->g", coef, xtx, coef)
+        r2 = 1 - resid_ss / total_ss
+    return coef, np.where(solvable, r2, np.nan), n.astype(np.int64)
+
+
+def batched_correlation(x, y, codes, n_groups):
+    # Pearson r of x and y within every group, nan-safe, from group sums
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    ok = ~(np.isnan(x) | np.isnan(y))
+    x, y, codes = x[ok], y[ok], np.asarray(codes)[ok]
+    s = group_sum(np.c_[np.ones(len(x)), x, y, x * x, y * y, x * y], grouping(codes, n_groups))
+    n, sx, sy, sxx, syy, sxy = s.T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx * sx) * (n * syy - sy * sy))
+    return np.where(n >= MIN_OBSERVATIONS, r, np.nan)
+
+
+def regression_table(frame, metric="simpson", by="year"):
+    # Correlation of metric with each indicator and the joint fit
+    # metric ~ poverty + ell, one row per value of `by` plus "All" pooled
+    # (just "All" when by is None)
+    y = frame[metric].to_numpy(dtype=np.float64)
+    X = frame[list(INDICATORS)].to_numpy(dtype=np.float64)
+    codes, names = np.zeros(len(frame), dtype=np.intp), ["All"]
+    if by is not None:
+        codes, names = group_codes(frame[by].to_numpy())
+        codes = np.r_[codes, np.full(len(frame), len(names))]
+        names = list(names) + ["All"]
+        y, X = np.tile(y, 2), np.tile(X, (2, 1))
+
+    coef, r2, n = batched_regression(y, X, codes, len(names))
+    out = pd.DataFrame({by or "group": names, "n": n})
+    for i, name in enumerate(INDICATORS):
+        out[f"r_{name}"] = batched_correlation(X[:, i], y, codes, len(names))
+    out["intercept"] = coef[:, 0]
+    for i, name in enumerate(INDICATORS, start=1):
+        out[f"b_{name}"] = coef[:, i]
+    out["r2"] = r2
+    return out[out["n"] > 0].reset_index(drop=True)
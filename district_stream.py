@@ -0,0 +1,173 @@
+import posixpath
+import re
+import zipfile
+from xml.etree.ElementTree import iterparse, parse
+
+import pandas as pd
+
+from data_cache import load_sheet
+from ingest import DEMOGRAPHIC_RACES
+from name_index import normalize
+
+DEMOGRAPHICS_FILE = "District Demographic Data.xlsx"
+
+KEY_COLS = ["YEAR", "COUNTY_DISTRICT_CODE", "DISTRICT_NAME"]
+
+# Column sets for projection, e.g. columns=RACE_COLUMNS
+RACE_COLUMNS = KEY_COLS + list(DEMOGRAPHIC_RACES.values()) + ["ENROLLMENT_ASIAN_PACIFIC_ISLANDER"]
+POVERTY_COLUMNS = KEY_COLS + ["ENROLLMENT_GRADES_K_12", "LUNCH_COUNT_FREE_REDUCED_PCT",
+                              "ELL_LEP_STUDENTS_ENROLLED_K_12_PCT"]
+
+CHUNK_ROWS = 5000
+
+_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+
+def district_code(code):
+    # "001090", 1090 and "1090" are the same district
+    return str(code).strip().lstrip("0")
+
+
+def _year(text):
+    # "2024" or "2024.0" -> 2024; None for a blank or non-numeric YEAR
+    try:
+        return int(float(text))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def _as_set(values, key):
+    if values is None:
+        return None
+    if isinstance(values, (str, int)):
+        values = [values]
+    return {key(v) for v in values}
+
+
+def _sheet_xml(zf, index=0):
+    # Path of the index-th worksheet inside the xlsx archive
+    book = parse(zf.open("xl/workbook.xml")).getroot()
+    rel_id = book.find(f"{_NS}sheets")[index].get(f"{_REL_NS}id")
+    rels = parse(zf.open("xl/_rels/workbook.xml.rels")).getroot()
+    target = next(r.get("Target") for r in rels if r.get("Id") == rel_id)
+    return target.lstrip("/") if target.startswith("/") else posixpath.join("xl", target)
+
+
+def _shared_strings(zf):
+    if "xl/sharedStrings.xml" not in zf.namelist():
+        return []
+    root = parse(zf.open("xl/sharedStrings.xml")).getroot()
+    return ["".join(t.text or "" for t in si.iter(f"{_NS}t")) for si in root]
+
+
+def _column(ref):
+    # "AB12" -> 27 (0-based)
+    n = 0
+    for ch in re.match(r"[A-Z]+", ref).group():
+        n = n * 26 + ord(ch) - 64
+    return n - 1
+
+
+def _sheet_rows(path, sheet_index=0):
+    # SAX-style pass over the sheet XML: yields {column: text} per row and
+    # drops each row element once read, emptied and detached from
+    # sheetData, so the tree never grows
+    with zipfile.ZipFile(path) as zf:
+        strings = _shared_strings(zf)
+        with zf.open(_sheet_xml(zf, sheet_index)) as f:
+            data = None
+            for event, elem in iterparse(f, events=("start", "end")):
+                if event == "start":
+                    if elem.tag == f"{_NS}sheetData":
+                        data = elem
+                    continue
+                if elem.tag != f"{_NS}row":
+                    continue
+                cells = {}
+                for c in elem:
+                    kind = c.get("t")
+                    if kind == "inlineStr":
+                        value = "".join(t.text or "" for t in c.iter(f"{_NS}t"))
+                    else:
+                        v = c.find(f"{_NS}v")
+                        if v is None:
+                            continue
+                        value = strings[int(v.text)] if kind == "s" else v.text
+                    cells[_column(c.get("r"))] = value
+                elem.clear()
+                data.remove(elem)
+                yield cells
+
+
+def _header(first):
+    # Column names from the sheet's first row
+    return [str(first.get(i, "")).strip() for i in range(max(first) + 1)]
+
+
+def iter_demographics(path=DEMOGRAPHICS_FILE, columns=None, years=None, districts=None,
+                      chunk_rows=CHUNK_ROWS):
+    # Stream the sheet in chunks of at most chunk_rows rows. Only the
+    # requested columns are kept, and rows outside years/districts (names or
+    # COUNTY_DISTRICT_CODEs) are dropped before they reach a DataFrame, so
+    # memory stays at one chunk whatever the file size; with years, a row
+    # whose YEAR is blank or not a number is dropped too. "*" (suppressed)
+    # becomes NaN.
+    years = _as_set(years, int)
+    names = _as_set(districts, normalize)
+    codes = _as_set(districts, district_code)
+
+    rows = _sheet_rows(path)
+    header = _header(next(rows))
+    columns = header if columns is None else list(columns)
+    keep = [header.index(col) for col in columns]
+    year_at, code_at, name_at = (header.index(col) for col in KEY_COLS)
+
+    chunk = []
+    for cells in rows:
+        if years is not None and _year(cells.get(year_at)) not in years:
+            continue
+        if districts is not None and not (normalize(cells.get(name_at, "")) in names
+                                          or district_code(cells.get(code_at, "")) in codes):
+            continue
+        chunk.append([cells.get(i) for i in keep])
+        if len(chunk) == chunk_rows:
+            yield _frame(chunk, columns)
+            chunk = []
+    if chunk:
+        yield _frame(chunk, columns)
+
+
+def _frame(chunk, columns):
+    df = pd.DataFrame(chunk, columns=columns)
+    for col in columns:
+        if col == "DISTRICT_NAME":
+            df[col] = df[col].astype("string")
+        else:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+
+def read_demographics(path=DEMOGRAPHICS_FILE, columns=None, years=None, districts=None):
+    # iter_demographics collected into one frame, e.g.
+    # read_demographics(districts="Oklahoma City", columns=RACE_COLUMNS)
+    chunks = list(iter_demographics(path, columns, years, districts))
+    if not chunks:
+        if columns is None:
+            rows = _sheet_rows(path)
+            columns = _header(next(rows))
+            rows.close()
+        return _frame([], list(columns))
+    return pd.concat(chunks, ignore_index=True)
+
+
+def load_demographics(path=DEMOGRAPHICS_FILE, columns=None, years=None):
+    # read_demographics for repeated use: the sheet comes from the arrow
+    # cache (parsed once, memory-mapped afterwards) instead of being
+    # streamed again, with the same columns and types
+    df = load_sheet(path)
+    columns = list(df.columns) if columns is None else list(columns)
+    if years is not None:
+        df = df[pd.to_numeric(df["YEAR"], errors="coerce").isin(_as_set(years, int))]
+    # Plain objects, as the stream yields, so _frame gives the same dtypes
+    return _frame(df[columns].to_numpy(dtype=object, na_value=None), columns)
@@ -0,0 +1,279 @@
+import argparse
+import shlex
+import sys
+
+import pandas as pd
+
+from data_cache import RACE_COLS
+from district_indicators import regression_table
+from engine import (BOUND_MIN_TOTAL, SCHOOL_COLS, WORKBOOK, Dataset, EngineError, average, export, rank,
+                    resolve, schools, search)
+from export import FORMATS
+from metric_registry import metric_names
+from profiling import MODES, enable, stage
+from rollups import MEAN_COLS
+from spatial import attach_coordinates, neighborhood_diversity, read_coordinates
+from trends import DISTRICT_METRICS, RELEASES, load_panels
+from views import MIN_TOTAL
+
+# Anything in metric_registry: total, simpson, entropy, p_<race>, and each
+# school's part of the ranked schools' theil, dissimilarity and isolation_<race>
+METRICS = metric_names()
+
+
+class CommandError(EngineError):
+    pass
+
+
+def _print(df):
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(df.to_string())
+
+
+def cmd_rank(session, args):
+    bottom = args.bottom is not None
+    ranked, col = rank(session, args.metric, args.bottom if bottom else args.top, bottom,
+                       args.min_total, args.bounds)
+    # dict.fromkeys: --metric total (or a bound column) is listed once
+    cols = dict.fromkeys(["School Name", "District", "County", "total", args.metric, col])
+    _print(ranked[list(cols)])
+
+
+def _average(session, kind, name, min_total):
+    name_id = resolve(session, kind, name)
+    label = session.index(kind).names[name_id]
+    counted, simpson = average(session, kind, name_id, min_total)
+    if counted == 0:
+        print(f"No valid schools in {kind} '{label}' after filtering.")
+    else:
+        print(f"Average Simpson Diversity Index for '{label}': {simpson:.4f}")
+
+
+def cmd_district_avg(session, args):
+    _average(session, "district", args.name, args.min_total)
+
+
+def cmd_county_avg(session, args):
+    _average(session, "county", args.name, args.min_total)
+
+
+def _schools(session, kind, name, min_total):
+    _print(schools(session, kind, resolve(session, kind, name), min_total)[SCHOOL_COLS])
+
+
+def cmd_district(session, args):
+    _schools(session, "district", args.name, args.min_total)
+
+
+def cmd_county(session, args):
+    _schools(session, "county", args.name, args.min_total)
+
+
+def cmd_school(session, args):
+    ids = search(session, "school", args.name)
+    if len(ids) == 0:
+        raise CommandError(f"No school matches '{args.name}'.")
+    _print(schools(session, "school", ids, min_total=None)[SCHOOL_COLS])
+
+
+def cmd_rollup(session, args):
+    # One level of the school -> district -> county -> metro -> state rollup
+    table = session.rollups(args.min_total).frame(args.level.title())
+    cols = [col for col in table.columns if col not in RACE_COLS or args.counts]
+    order = table.nsmallest if args.ascending else table.nlargest
+    _print(order(args.top, args.sort)[cols] if args.sort else table[cols].head(args.top))
+
+
+def _read_names(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def cmd_export(session, args):
+    path = f"{args.output}.{FORMATS[args.format]}"
+    districts = _read_names(args.districts_file) if args.districts_file else None
+    rows = export(session.grouped, path, args.format, districts)
+    print(f"Exported {rows} rows to {path}")
+
+
+def cmd_neighborhood(session, args):
+    # Schools least diverse compared with the schools around them
+    located = attach_coordinates(session.grouped, read_coordinates(args.coordinates))
+    print(f"{located['Latitude'].notna().sum()} of {len(located)} schools located")
+    if args.k is not None:
+        area = neighborhood_diversity(located, k=args.k)
+    else:
+        area = neighborhood_diversity(located, radius_km=args.radius)
+    area = area[session.views.mask(args.min_total)[area.index] & (area["neighbors"] > 0)]
+    _print(area.nsmallest(args.top, "simpson_gap")[
+        ["School Name", "District", "County", "total", "simpson", "neighbors", "area_simpson", "simpson_gap"]])
+
+
+def cmd_trend(session, args):
+    # Units changing fastest in a metric: between two years with --from and
+    # --to, otherwise by least-squares slope over every year they appear
+    schools, districts = load_panels(args.releases or RELEASES)
+    panel = districts if args.level == "district" else schools
+    if args.metric not in panel.metrics:
+        raise CommandError(f"{args.metric} is only tracked for districts")
+    label = ["District", "County"] if args.level == "district" else ["School Name", "District"]
+    if args.start is not None or args.end is not None:
+        if args.start is None or args.end is None:
+            raise CommandError("give both --from and --to")
+        try:
+            table = panel.deltas(args.start, args.end, [args.metric])
+        except KeyError as e:
+            raise CommandError(e.args[0])
+        col = f"{args.metric}_change"
+        cols = label + [f"{args.metric}_{args.start}", f"{args.metric}_{args.end}", col]
+    else:
+        table = panel.trends([args.metric])
+        col = f"{args.metric}_slope"
+        cols = label + ["years", "first_year", col]
+    rank = table.nsmallest if args.falling else table.nlargest
+    _print(rank(args.top, col)[cols])
+
+
+def cmd_indicators(session, args):
+    # Diversity against district poverty (free/reduced lunch %) and ELL %:
+    # per year across districts, or across this dataset's schools
+    indicators, schools = session.indicators(args.year)
+    if args.schools:
+        matched = schools["poverty"].notna() | schools["ell"].notna()
+        print(f"{matched.sum()} of {len(schools)} schools matched a district in the demographics data")
+        _print(regression_table(schools[matched], args.metric, by=None))
+    else:
+        _print(regression_table(indicators.table, args.metric))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="diversity_cli", description="Oklahoma school diversity reports")
+    parser.add_argument("--workbook", default=WORKBOOK, help="school race/gender workbook to load")
+    parser.add_argument("--profile", choices=MODES,
+                        help="time every stage (JSON lines on stderr); cprofile also dumps pstats")
+    parser.add_argument("--profile-output", help="write the stage timings to this file instead")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rank = sub.add_parser("rank", help="top or bottom schools by a metric")
+    rank.add_argument("--metric", choices=METRICS, default="simpson")
+    which = rank.add_mutually_exclusive_group()
+    which.add_argument("--top", type=int, default=40)
+    which.add_argument("--bottom", type=int)
+    rank.add_argument("--bounds", action="store_true",
+                      help="rank by bootstrap confidence bound instead of dropping small schools")
+    rank.add_argument("--min-total", type=int,
+                      help=f"default {MIN_TOTAL}, or {BOUND_MIN_TOTAL} with --bounds")
+    rank.set_defaults(func=cmd_rank)
+
+    for name, func, help_text in [
+        ("district-avg", cmd_district_avg, "average Simpson index of a district"),
+        ("county-avg", cmd_county_avg, "average Simpson index of a county"),
+        ("district", cmd_district, "schools in a district"),
+        ("county", cmd_county, "schools in a county"),
+        ("school", cmd_school, "search schools by name"),
+    ]:
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("name")
+        p.set_defaults(func=func)
+
+    roll = sub.add_parser("rollup", help="pooled and mean diversity of every district, county, metro or the state")
+    roll.add_argument("--level", choices=["district", "county", "metro", "state"], default="district")
+    roll.add_argument("--sort", choices=["total", "schools", "simpson", "entropy", "theil", "dissimilarity"]
+                      + MEAN_COLS, help="order by this column, largest first")
+    roll.add_argument("--ascending", action="store_true", help="smallest first")
+    roll.add_argument("--top", type=int, default=40)
+    roll.add_argument("--counts", action="store_true", help="show the race counts too")
+    roll.set_defaults(func=cmd_rollup)
+
+    export = sub.add_parser("export", help="write schools to a file")
+    export.add_argument("--districts-file", help="file with one district name per line")
+    export.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    export.add_argument("--output", required=True, help="file name without extension")
+    export.set_defaults(func=cmd_export)
+
+    near = sub.add_parser("neighborhood", help="schools least diverse compared with nearby schools")
+    near.add_argument("coordinates", help="CSV or GeoJSON of school locations")
+    area = near.add_mutually_exclusive_group()
+    area.add_argument("--radius", type=float, default=10.0, help="neighborhood radius in km")
+    area.add_argument("--k", type=int, help="use the k nearest schools instead of a radius")
+    near.add_argument("--top", type=int, default=40)
+    near.set_defaults(func=cmd_neighborhood)
+
+    trend = sub.add_parser("trend", help="schools or districts changing fastest across releases")
+    trend.add_argument("--level", choices=["school", "district"], default="district")
+    trend.add_argument("--metric", choices=DISTRICT_METRICS, default="theil")
+    trend.add_argument("--from", dest="start", type=int, help="compare this school year ...")
+    trend.add_argument("--to", dest="end", type=int, help="... with this one instead of fitting a trend")
+    trend.add_argument("--falling", action="store_true", help="largest decreases first")
+    trend.add_argument("--top", type=int, default=20)
+    trend.add_argument("--releases", nargs="+", help="workbooks to align (default: every known release)")
+    trend.set_defaults(func=cmd_trend)
+
+    ind = sub.add_parser("indicators", help="diversity against district poverty and ELL share")
+    ind.add_argument("--metric", choices=["simpson", "entropy"], default="simpson")
+    ind.add_argument("--schools", action="store_true", help="regress this dataset's schools instead of districts")
+    ind.add_argument("--year", type=int, help="demographics year schools are joined to (default: latest)")
+    ind.set_defaults(func=cmd_indicators)
+
+    batch = sub.add_parser("batch", help="run one command per line from a file ('-' for stdin)")
+    batch.add_argument("file")
+    batch.set_defaults(func=None)
+
+    for p in [near] + [sub.choices[n] for n in ["district-avg", "county-avg", "district", "county", "rollup"]]:
+        p.add_argument("--min-total", type=int, default=MIN_TOTAL)
+    return parser
+
+
+def run_batch(session, parser, lines):
+    # Every line is a command as it would be typed after diversity_cli;
+    # a failing line is reported and the rest still run
+    failures = 0
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        print(f"\n>>> {line}")
+        try:
+            args = parser.parse_args(shlex.split(line))
+            if args.func is None:
+                raise CommandError("batch files cannot run other batch files")
+            with stage(f"command/{args.command}"):
+                args.func(session, args)
+        except (EngineError, OSError) as e:
+            print(e, file=sys.stderr)
+            failures += 1
+        except Exception as e:
+            # Anything else a command raises (bad input files, say) fails
+            # the line, not the batch
+            print(f"{type(e).__name__}: {e}", file=sys.stderr)
+            failures += 1
+        except SystemExit:
+            failures += 1
+    return failures
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.profile:
+        enable(args.profile, args.profile_output)
+    with stage("session"):
+        session = Dataset(args.workbook)
+    if args.func is not None:
+        try:
+            with stage(f"command/{args.command}"):
+                args.func(session, args)
+        except EngineError as e:
+            print(e, file=sys.stderr)
+            return 1
+        return 0
+    if args.file == "-":
+        failures = run_batch(session, parser, sys.stdin)
+    else:
+        with open(args.file) as f:
+            failures = run_batch(session, parser, f)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from diversity_cli import METRICS
+from engine import (SCHOOL_COLS, WORKBOOK, Dataset, EngineError, average, export, rank, resolve, schools,
+                    search)
+from export import FORMATS
+from profiling import MODES, enable, stage
+from rollups import LEVELS
+from views import MIN_TOTAL
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+# Responses kept for repeated queries; the dataset never changes while the
+# service runs, so entries only leave when the cache is full
+CACHE_SIZE = 1024
+
+# Exports are written here, whatever path the request asks for
+EXPORT_DIR = "exports"
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _param(params, name, default=None, kind=str):
+    if name not in params:
+        if default is None:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"missing parameter '{name}'")
+        return default
+    try:
+        return kind(params[name][-1])
+    except ValueError:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"bad value for '{name}': {params[name][-1]!r}")
+
+
+def _records(df):
+    # numpy scalars and NA -> plain JSON values
+    return json.loads(df.to_json(orient="records"))
+
+
+def search_names(session, kind, params):
+    q = _param(params, "q")
+    return {"query": q, "matches": list(session.index(kind).names[search(session, kind, q)])}
+
+
+def search_schools(session, params):
+    q = _param(params, "q")
+    found = schools(session, "school", search(session, "school", q), min_total=None)
+    return {"query": q, "schools": _records(found[SCHOOL_COLS])}
+
+
+def ranking(session, params):
+    metric = _param(params, "metric", "simpson")
+    if metric not in METRICS:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"metric must be one of {METRICS}")
+    min_total = _param(params, "min_total", kind=int) if "min_total" in params else None
+    bounds = _param(params, "bounds", "0") not in ("0", "false", "")
+    bottom = "bottom" in params
+    k = _param(params, "bottom", kind=int) if bottom else _param(params, "top", 40, int)
+    ranked, col = rank(session, metric, k, bottom, min_total, bounds)
+    # metric=total would otherwise give to_json a duplicate column
+    cols = list(dict.fromkeys(["School Name", "District", "County", "total", metric, col]))
+    return {"metric": col, "schools": _records(ranked[cols])}
+
+
+def simpson_average(session, kind, params):
+    name_id = resolve(session, kind, _param(params, "name"))
+    counted, simpson = average(session, kind, name_id, _param(params, "min_total", MIN_TOTAL, int))
+    return {kind: session.index(kind).names[name_id], "schools": counted,
+            "simpson": None if counted == 0 else simpson}
+
+
+def schools_in(session, kind, params):
+    name_id = resolve(session, kind, _param(params, "name"))
+    found = schools(session, kind, name_id, _param(params, "min_total", MIN_TOTAL, int))
+    return {kind: session.index(kind).names[name_id], "schools": _records(found[SCHOOL_COLS])}
+
+
+def rollup(session, params):
+    # Every row of a level, or the one named (?level=metro&name=okc metro)
+    level = _param(params, "level", "district").title()
+    if level not in LEVELS[1:]:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"level must be one of {[name.lower() for name in LEVELS[1:]]}")
+    rollups = session.rollups(_param(params, "min_total", MIN_TOTAL, int))
+    if "name" not in params:
+        return {"level": level, "rows": _records(rollups.frame(level))}
+    row = rollups.get(level, _param(params, "name"))
+    if row is None:
+        raise EngineError(f"No {level.lower()} named '{_param(params, 'name')}'.")
+    return {"level": level, "rows": _records(row.to_frame().T)}
+
+
+ROUTES = {
+    "/search/county": lambda s, p: search_names(s, "county", p),
+    "/search/district": lambda s, p: search_names(s, "district", p),
+    "/search/school": search_schools,
+    "/rank": ranking,
+    "/average/district": lambda s, p: simpson_average(s, "district", p),
+    "/average/county": lambda s, p: simpson_average(s, "county", p),
+    "/district": lambda s, p: schools_in(s, "district", p),
+    "/county": lambda s, p: schools_in(s, "county", p),
+    "/rollup": rollup,
+}
+
+
+class QueryService:
+    # One warm Dataset behind a small HTTP/1.1 JSON server. Cached responses
+    # are answered on the event loop; anything not cached runs on one query
+    # thread, so a slow first build (bootstrap intervals, the rollups of a
+    # new min_total) never stalls the other connections. One thread also
+    # keeps the Dataset's lazy caches from being built twice at once.
+    # Exports go to the shared writer thread.
+
+    def __init__(self, session, cache_size=CACHE_SIZE, export_dir=EXPORT_DIR):
+        self.session = session
+        self.cache_size = cache_size
+        self.export_dir = export_dir
+        self._cache = OrderedDict()
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query")
+        self.hits = self.misses = 0
+        self.started = time.time()
+
+    def warm(self, min_total=MIN_TOTAL):
+        # Build what the first /rank?bounds=1 and /rollup would otherwise
+        # build: the bootstrap intervals and the default rollups
+        with stage("service/warm", rows=len(self.session.grouped)):
+            self.session.interval_views()
+            self.session.rollups(min_total)
+
+    def _answer(self, path, params):
+        try:
+            status, payload = HTTPStatus.OK, ROUTES[path](self.session, params)
+        except EngineError as e:
+            status, payload = HTTPStatus.NOT_FOUND, {"error": str(e)}
+        except RequestError as e:
+            status, payload = e.status, {"error": str(e)}
+        return status, json.dumps(payload).encode()
+
+    async def query(self, path, params):
+        # (status, body) of a read-only endpoint, from the cache if seen before
+        key = (path, tuple(sorted((k, tuple(v)) for k, v in params.items())))
+        if key in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(self._worker, self._answer, path, params)
+        self._cache[key] = response
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return response
+
+    async def export(self, params):
+        file_type = _param(params, "format", "csv")
+        if file_type not in FORMATS:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"format must be one of {sorted(FORMATS)}")
+        name = os.path.basename(_param(params, "output"))
+        os.makedirs(self.export_dir, exist_ok=True)
+        path = os.path.join(self.export_dir, f"{name}.{FORMATS[file_type]}")
+
+        try:
+            future = export(self.session.grouped, path, file_type, params.get("district"), background=True)
+        except EngineError as e:
+            raise RequestError(HTTPStatus.NOT_FOUND, str(e))
+        rows, seconds = await asyncio.wrap_future(future)
+        return {"path": path, "rows": rows, "seconds": seconds}
+
+    def stats(self):
+        return {"schools": len(self.session.grouped), "cached": len(self._cache), "hits": self.hits,
+                "misses": self.misses, "uptime_s": time.time() - self.started}
+
+    async def respond(self, target):
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+        try:
+            if url.path in ROUTES:
+                return await self.query(url.path, params)
+            if url.path == "/export":
+                return HTTPStatus.OK, json.dumps(await self.export(params)).encode()
+            if url.path == "/stats":
+                return HTTPStatus.OK, json.dumps(self.stats()).encode()
+        except RequestError as e:
+            return e.status, json.dumps({"error": str(e)}).encode()
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, json.dumps({"error": f"{type(e).__name__}: {e}"}).encode()
+        return HTTPStatus.NOT_FOUND, json.dumps({"error": f"no endpoint {url.path}"}).encode()
+
+    async def handle(self, reader, writer):
+        # Keep-alive connection: one request after another until the client
+        # closes it or asks to
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    await self._send(writer, HTTPStatus.BAD_REQUEST, b'{"error": "bad request line"}', False)
+                    break
+                headers = {}
+                while (header := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if "content-length" in headers:
+                    await reader.readexactly(int(headers["content-length"]))
+
+                keep_alive = (headers.get("connection", "").lower() != "close"
+                              and version.upper() == "HTTP/1.1")
+                if method not in ("GET", "HEAD"):
+                    status, body = HTTPStatus.METHOD_NOT_ALLOWED, b'{"error": "only GET is supported"}'
+                else:
+                    path = urlsplit(target).path
+                    known = path in ROUTES or path in ("/export", "/stats")
+                    with stage(f"http{path}" if known else "http/other"):
+                        status, body = await self.respond(target)
+                await self._send(writer, status, b"" if method == "HEAD" else body, keep_alive, len(body))
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send(self, writer, status, body, keep_alive, length=None):
+        head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(body) if length is None else length}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(service, host=HOST, port=PORT, socket_path=None):
+    if socket_path:
+        server = await asyncio.start_unix_server(service.handle, path=socket_path)
+        where = f"unix:{socket_path}"
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+        where = f"http://{host}:{port}"
+    print(f"Serving {len(service.session.grouped)} schools on {where}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="diversity_service",
+                                     description="Serve diversity queries from one warm dataset")
+    parser.add_argument("--workbook", default=WORKBOOK, help="school race/gender workbook to load")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--socket", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="responses kept for repeated queries")
+    parser.add_argument("--export-dir", default=EXPORT_DIR, help="directory exports are written to")
+    parser.add_argument("--profile", choices=MODES, help="time every request and stage (JSON lines)")
+    parser.add_argument("--profile-output", help="write the stage timings to this file instead of stderr")
+    args = parser.parse_args(argv)
+    if args.profile:
+        enable(args.profile, args.profile_output)
+
+    service = QueryService(Dataset(args.workbook), args.cache_size, args.export_dir)
+    service.warm()
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
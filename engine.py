@@ -0,0 +1,178 @@
+import os
+
+from data_cache import load_sheet
+from district_indicators import DistrictIndicators
+from export import FORMATS, district_sheets, export_in_background, write_table, write_xlsx
+from metrics_table import build_metrics_table, metrics_table
+from name_index import NameIndex, normalize
+from rollups import OKC_METRO_DISTRICTS, Rollups
+from uncertainty import with_intervals
+from views import MIN_TOTAL, SchoolViews
+
+# The one pipeline behind every front-end (the menu scripts, diversity_cli
+# and diversity_service):
+#   load -> aggregate -> metrics   grade rows to a cached per-school table
+#   Dataset                        that table with its search indexes and views
+#   search / resolve / schools     names to rows
+#   Dataset.rollups                district, county, metro and state tables
+#   rank / export                  the reports
+
+WORKBOOK = "School Totals by Ethnicity and GenderSY2024 1.xlsx"
+
+BOUND_METRICS = ["simpson", "entropy"]
+
+# A single student has no diversity to measure, at any confidence
+BOUND_MIN_TOTAL = 1
+
+# What each kind of name lookup searches
+KINDS = {"county": "County", "district": "District", "school": "School Name"}
+
+SCHOOL_COLS = ["School Name", "District", "County", "total", "simpson", "entropy"]
+
+
+class EngineError(Exception):
+    pass
+
+
+def load(path=WORKBOOK, sheet_name=0):
+    # Grade-level rows of a workbook sheet, read through the arrow cache
+    return load_sheet(path, sheet_name)
+
+
+def aggregate(raw, previous=None):
+    # Grade rows -> one row per school with race counts, total, simpson,
+    # entropy and the fingerprint that marks what went into it. With a
+    # previous aggregate() table only changed schools are redone; one
+    # without fingerprints (metrics() drops them) can't say what changed.
+    if previous is not None and "fingerprint" not in previous.columns:
+        raise EngineError("previous has no fingerprint column; pass an earlier aggregate() result")
+    return build_metrics_table(raw, previous)
+
+
+def metrics(path=WORKBOOK, sheet_name=0, previous=None):
+    # load + aggregate, persisted: the per-school table of a release
+    return metrics_table(path, sheet_name, previous)
+
+
+class Dataset:
+    # One release's school table with everything the reports reuse: a name
+    # index per kind, the filter/ranking views, and (on first use) the level
+    # rollups, bootstrap intervals and the district poverty/ELL join
+
+    def __init__(self, workbook=WORKBOOK, sheet_name=0):
+        self.grouped = metrics(workbook, sheet_name)
+        self.county_index = NameIndex(self.grouped["County"])
+        self.district_index = NameIndex(self.grouped["District"])
+        self.school_index = NameIndex(self.grouped["School Name"])
+        self.views = SchoolViews(self.grouped)
+        self._rollups = {}
+        self._interval_views = None
+        self._indicators = None
+        self._indicator_rows = {}
+
+    def index(self, kind):
+        if kind not in KINDS:
+            raise EngineError(f"kind must be one of {list(KINDS)}, not {kind!r}")
+        return getattr(self, f"{kind}_index")
+
+    def rollups(self, min_total=MIN_TOTAL):
+        # Every level's table, built on first use; school means over the
+        # schools the rankings keep at min_total
+        if min_total not in self._rollups:
+            self._rollups[min_total] = Rollups(self.grouped, self.views.mask(min_total))
+        return self._rollups[min_total]
+
+    def interval_views(self):
+        # Views over the table with bootstrap intervals, resampled on first use
+        if self._interval_views is None:
+            self._interval_views = SchoolViews(with_intervals(self.grouped))
+        return self._interval_views
+
+    def indicators(self, year=None):
+        # The district poverty/ELL table (read on first use) and this
+        # dataset's schools joined to it for year, each worked out once
+        if self._indicators is None:
+            self._indicators = DistrictIndicators()
+        if year not in self._indicator_rows:
+            self._indicator_rows[year] = self._indicators.positions(
+                self.grouped["District"], self.grouped["District Code"], year)
+        return self._indicators, self._indicators.attach(self.grouped, positions=self._indicator_rows[year])
+
+
+def search(data, kind, text):
+    # Ids of the county, district or school names containing text (or the
+    # closest spellings when none does), in alphabetical order
+    return data.index(kind).search(text)
+
+
+def resolve(data, kind, name):
+    # A single match, or an exact name among several; otherwise the caller
+    # has to be more specific
+    index = data.index(kind)
+    ids = index.search(name)
+    if len(ids) == 0:
+        raise EngineError(f"No {kind} matches '{name}'.")
+    if len(ids) > 1:
+        exact = [i for i in ids if index.keys[i] == normalize(name)]
+        if len(exact) != 1:
+            choices = ", ".join(index.names[ids])
+            raise EngineError(f"'{name}' matches several {kind}s: {choices}")
+        ids = exact
+    return ids[0]
+
+
+def schools(data, kind, name_ids, min_total=MIN_TOTAL):
+    # Schools carrying these names, filtered like the rankings (Epic and
+    # min_total); min_total None keeps every row
+    rows = data.index(kind).rows(name_ids)
+    if min_total is None:
+        return data.grouped.iloc[rows]
+    return data.views.filter(rows, min_total)
+
+
+def average(data, kind, name_id, min_total=MIN_TOTAL):
+    # (schools counted, unweighted mean simpson) of a district or county,
+    # read from the rollups
+    row = data.rollups(min_total).get(KINDS[kind], data.index(kind).names[name_id])
+    return int(row["schools"]), row["mean_simpson"]
+
+
+def rank(data, metric, k, bottom=False, min_total=None, bounds=False):
+    # Top (or bottom, lowest first) k schools by metric and the column they
+    # are ordered by. With bounds the order is by the confidence bound
+    # instead: the lower bound for the top, the upper bound for the bottom,
+    # so a small school only ranks as high (or low) as its counts support.
+    if not bounds:
+        views = data.views
+        min_total = MIN_TOTAL if min_total is None else min_total
+    else:
+        if metric not in BOUND_METRICS:
+            raise EngineError(f"confidence bounds exist for {', '.join(BOUND_METRICS)} only")
+        views = data.interval_views()
+        min_total = BOUND_MIN_TOTAL if min_total is None else min_total
+        metric = f"{metric}_high" if bottom else f"{metric}_low"
+    ranked = views.bottom if bottom else views.top
+    return ranked(metric, k, min_total), metric
+
+
+def export(table, path, file_type=None, districts=None, background=False):
+    # Write table to path (type from the extension unless given). With
+    # districts only those are written; an xlsx gets one sheet each after an
+    # "All districts" sheet. Returns the rows written, or with background a
+    # future of (rows, seconds) from the export writer thread.
+    file_type = file_type or os.path.splitext(path)[1].lstrip(".").lower()
+    if file_type not in FORMATS:
+        raise EngineError(f"file type must be one of {sorted(FORMATS)}, not {file_type!r}")
+    if districts is None:
+        write, args = write_table, (table, path, file_type)
+    else:
+        sheets = district_sheets(table, districts)
+        if not sheets:
+            raise EngineError("No matching districts found in dataset.")
+        if FORMATS[file_type] == "xlsx":
+            write, args = write_xlsx, (sheets, path)
+        else:
+            write, args = write_table, (sheets["All districts"], path, file_type)
+    if background:
+        return export_in_background(write, *args, path=path)
+    return write(*args)
@@ -0,0 +1,109 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from openpyxl import Workbook
+
+from metrics_table import with_proportions
+from name_index import normalize
+from profiling import timed
+
+# Accepted answers to "file type?" -> file extension
+FORMATS = {"csv": "csv", "parquet": "parquet", "xlsx": "xlsx", "excel": "xlsx"}
+
+# First sheet of district_sheets: every requested district together
+ALL_SHEET = "All districts"
+
+# One writer thread: exports run behind the menu, one after another
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+
+
+def _rows(df):
+    # Plain Python values for openpyxl; missing values become empty cells
+    values = df.astype(object).where(df.notna(), None)
+    return values.itertuples(index=False, name=None)
+
+
+def _sheet_title(name, used):
+    # Excel allows 31 characters and no []:*?/\ in a sheet name
+    title = re.sub(r"[\[\]:*?/\\]", "-", str(name))[:31] or "Sheet"
+    base, n = title, 2
+    while title.lower() in used:
+        suffix = f" ({n})"
+        title, n = base[:31 - len(suffix)] + suffix, n + 1
+    used.add(title.lower())
+    return title
+
+
+@timed("export/xlsx")
+def write_xlsx(sheets, path):
+    # Write-only (streaming) workbook: rows go straight to the file instead
+    # of building every cell object first. sheets maps sheet name -> frame.
+    # Returns the number of distinct rows written: the "All districts" sheet
+    # of district_sheets already holds every row of the sheets after it.
+    wb = Workbook(write_only=True)
+    used = set()
+    for name, df in sheets.items():
+        df = with_proportions(df)
+        ws = wb.create_sheet(_sheet_title(name, used))
+        ws.append([str(col) for col in df.columns])
+        for row in _rows(df):
+            ws.append(row)
+    wb.save(path)
+    if ALL_SHEET in sheets:
+        return len(sheets[ALL_SHEET])
+    return sum(len(df) for df in sheets.values())
+
+
+@timed("export")
+def write_table(df, path, file_type):
+    # Exported files carry the p_<race> columns the in-memory table leaves out
+    ext = FORMATS[file_type]
+    if ext == "csv":
+        with_proportions(df).to_csv(path, index=False)
+    elif ext == "parquet":
+        with_proportions(df).to_parquet(path, index=False)
+    else:
+        write_xlsx({"Sheet1": df}, path)
+    return len(df)
+
+
+def district_sheets(table, districts):
+    # One frame per requested district, from a single grouping of the table.
+    # The first sheet holds all of them together.
+    keys = table["District"].astype(object).map(normalize, na_action="ignore")
+    groups = table.groupby(keys, sort=False).indices
+    sheets = {}
+    for district in districts:
+        rows = groups.get(normalize(district))
+        if rows is not None:
+            sheets[table["District"].iloc[rows[0]]] = table.iloc[rows]
+    if not sheets:
+        return {}
+    found = pd.concat(sheets.values()).sort_index()
+    return {ALL_SHEET: found, **sheets}
+
+
+def _timed(write, args):
+    start = time.perf_counter()
+    rows = write(*args)
+    return rows, time.perf_counter() - start
+
+
+def export_in_background(write, *args, path):
+    # Run write(*args) on the writer thread and report rows/sec when done.
+    # write returns the number of rows it wrote.
+    future = _writer.submit(_timed, write, args)
+
+    def report(done):
+        try:
+            rows, seconds = done.result()
+        except Exception as e:
+            print(f"\nError exporting file: {e}")
+            return
+        rate = rows / seconds if seconds > 0 else float("inf")
+        print(f"\nExported {rows} rows to {path} in {seconds:.2f}s ({rate:,.0f} rows/sec)")
+
+    future.add_done_callback(report)
+    return future
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+from data_cache import GENDER_COLS, RACE_COLS
+from metrics_table import KEY_COLS
+from segregation import diversity, group_codes, group_indices
+
+# Grade codes of the race grids, youngest first
+GRADES = ["P3H", "P3F", "PKH", "PKF", "KGH", "KGF",
+          "1", "2", "3", "4", "5", "6", "7", "8", "9", "10", "11", "12", "OHP"]
+
+GRADE_BANDS = {
+    "Pre-K": ["P3H", "P3F", "PKH", "PKF"],
+    "K-5": ["KGH", "KGF", "1", "2", "3", "4", "5"],
+    "6-8": ["6", "7", "8"],
+    "9-12": ["9", "10", "11", "12"],
+    "OHP": ["OHP"],
+}
+
+GENDERS = ["M", "F"]
+
+
+def _metrics_frame(labels, name, r):
+    frame = pd.DataFrame({name: labels, "total": r["total"].astype(np.int64),
+                          "simpson": r["simpson"], "entropy": r["entropy"]})
+    for key in ["theil", "dissimilarity"]:
+        if key in r:
+            frame[key] = r[key]
+    return frame
+
+
+class GradeCube:
+    # Enrollment as one int32 array indexed [school, grade, race, gender],
+    # built from a race grid sheet (one row per school and grade). Any slice
+    # or rollup is a sum over axes, so grade, band, gender and School Level
+    # breakdowns all come from the same array without refiltering rows.
+
+    def __init__(self, raw):
+        raw = raw[raw["Grade"].isin(GRADES)].dropna(subset=KEY_COLS)
+        school = raw.groupby(KEY_COLS, sort=False, observed=True).ngroup().to_numpy()
+        grade = pd.Categorical(raw["Grade"], categories=GRADES).codes
+
+        self.schools = (raw.groupby(KEY_COLS, sort=False, observed=True)[["School Name", "District", "County", "School Level"]]
+                        .first().reset_index())
+        self.cube = np.zeros((len(self.schools), len(GRADES), len(RACE_COLS), len(GENDERS)), dtype=np.int32)
+        values = raw[GENDER_COLS].to_numpy(dtype=np.int32).reshape(len(raw), len(RACE_COLS), len(GENDERS))
+        np.add.at(self.cube, (school, grade), values)
+
+    def _grade_mask(self, grades):
+        # None = all grades; a band name, a grade code, or a list of either
+        if grades is None:
+            return slice(None)
+        if isinstance(grades, str):
+            grades = [grades]
+        codes = [g for item in grades for g in GRADE_BANDS.get(item, [item])]
+        return [GRADES.index(g) for g in codes]
+
+    def _gender_mask(self, gender):
+        return slice(None) if gender is None else [GENDERS.index(gender)]
+
+    def counts(self, grades=None, gender=None):
+        # schools x races for the chosen grades and gender
+        sub = self.cube[:, self._grade_mask(grades)][..., self._gender_mask(gender)]
+        return sub.sum(axis=(1, 3))
+
+    def school_metrics(self, grades=None, gender=None):
+        # Per-school total, Simpson and entropy of one slice
+        total, _, simpson, entropy = diversity(self.counts(grades, gender))
+        frame = self.schools.copy()
+        frame["total"] = total.astype(np.int64)
+        frame["simpson"] = simpson
+        frame["entropy"] = entropy
+        return frame
+
+    def by_band(self, bands=GRADE_BANDS, gender=None):
+        # Statewide diversity and between-school segregation per grade band:
+        # every (school, band) pair is a unit, grouped by band
+        names = list(bands)
+        band_of = np.full(len(GRADES), -1)
+        for b, name in enumerate(names):
+            band_of[[GRADES.index(g) for g in bands[name]]] = b
+        sub = self.cube[..., self._gender_mask(gender)].sum(axis=3)
+        units = np.zeros((len(self.schools), len(names), len(RACE_COLS)), dtype=np.int64)
+        keep = band_of >= 0
+        np.add.at(units, (slice(None), band_of[keep]), sub[:, keep])
+        codes = np.tile(np.arange(len(names)), len(self.schools))
+        return _metrics_frame(names, "Band", group_indices(units.reshape(-1, len(RACE_COLS)), codes, len(names)))
+
+    def by_grade(self, gender=None):
+        return self.by_band({g: [g] for g in GRADES}, gender).rename(columns={"Band": "Grade"})
+
+    def by_gender(self, grades=None):
+        # (school, gender) units grouped by gender
+        sub = self.cube[:, self._grade_mask(grades)].sum(axis=1)
+        units = sub.transpose(0, 2, 1).reshape(-1, len(RACE_COLS))
+        codes = np.tile(np.arange(len(GENDERS)), len(self.schools))
+        return _metrics_frame(GENDERS, "Gender", group_indices(units, codes, len(GENDERS)))
+
+    def by_level(self, grades=None, gender=None):
+        # Schools grouped by School Level (Elementary, Middle, ...)
+        codes, names = group_codes(self.schools["School Level"].to_numpy())
+        r = group_indices(self.counts(grades, gender), codes, len(names))
+        return _metrics_frame(np.asarray(names), "School Level", r)
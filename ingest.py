@@ -0,0 +1,149 @@
+import glob
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_cache import GENDER_COLS, RACE_COLS, RACE_MAP, load_sheet
+
+# Every layout is normalized to these columns. Unit is "school" or
+# "district"; gender counts are missing for sources that only give races.
+INGEST_COLS = (["School Year", "Unit", "County", "District", "District Code", "School Code",
+                "School Name", "School Level", "Grade", "Source"] + RACE_COLS + GENDER_COLS)
+INGEST_DTYPES = {"School Year": "Int32",
+                 **{col: "string" for col in INGEST_COLS[1:10]},
+                 "School Code": "Int32",
+                 **{col: "Int32" for col in RACE_COLS + GENDER_COLS}}
+
+# "District Demographic Data.xlsx" column for each race. Older years only
+# report Asian and Pacific Islander together; that count goes to Asian.
+DEMOGRAPHIC_RACES = {
+    "Hispanic": "ENROLLMENT_HISPANIC",
+    "American Indian": "ENROLLMENT_INDIAN",
+    "Asian": "ENROLLMENT_ASIAN",
+    "Black": "ENROLLMENT_BLACK",
+    "Pacific Islander": "ENROLLMENT_PACIFIC_ISLANDER",
+    "White": "ENROLLMENT_WHITE",
+    "Multi": "ENROLLMENT_MULTIRACIAL",
+}
+
+# "OKC Metro.xlsx" uses short district names and one AAPI column, which is
+# counted as Asian
+METRO_DISTRICTS = {"OKCPS": "OKLAHOMA CITY", "PC": "PUTNAM CITY", "MIDDEL": "MIDWEST CITY-DEL CITY"}
+METRO_RACES = {"Hispanic": "Hispanic", "American Indian": "American Indian", "Asian": "AAPI",
+               "Black": "Black", "White": "White", "Multi": "Multi"}
+
+
+def _counts(values):
+    # Suppressed cells ("*") and blanks become missing counts
+    return pd.to_numeric(values, errors="coerce").round().astype("Int32")
+
+
+def _school_grades(df, source):
+    # ORR / School Totals grids: one row per school and grade, M/F per race
+    out = pd.DataFrame({
+        "School Year": pd.to_numeric(df["School Year"], errors="coerce").astype("Int32"),
+        "Unit": "school",
+        "County": df["County"],
+        "District": df["District"],
+        "District Code": df["District Code"],
+        "School Code": df["School Code"],
+        "School Name": df["School Name"],
+        "School Level": df["School Level"],
+        "Grade": df["Grade"],
+        "Source": source,
+    })
+    for race, cols in RACE_MAP.items():
+        out[race] = _counts(df[cols[0]] + df[cols[1]])
+    for col in GENDER_COLS:
+        out[col] = _counts(df[col])
+    return out
+
+
+def _district_demographics(df, source):
+    # One row per district and YEAR, race counts only
+    out = pd.DataFrame({
+        "School Year": pd.to_numeric(df["YEAR"], errors="coerce").astype("Int32"),
+        "Unit": "district",
+        "District": df["DISTRICT_NAME"],
+        "District Code": df["COUNTY_DISTRICT_CODE"].astype("string"),
+        "Source": source,
+    })
+    for race, col in DEMOGRAPHIC_RACES.items():
+        out[race] = _counts(df[col]) if col in df.columns else pd.NA
+    if "ENROLLMENT_ASIAN_PACIFIC_ISLANDER" in df.columns:
+        out["Asian"] = out["Asian"].fillna(_counts(df["ENROLLMENT_ASIAN_PACIFIC_ISLANDER"]))
+    return out
+
+
+def _metro_schools(df, source, sheet_name):
+    # "2017-2018 ES": one row per school; rows without a district are the
+    # per-district and overall "Totals" lines
+    district = df.iloc[:, 2]
+    df = df[district.notna() & df["School Name"].notna()]
+    district = df.iloc[:, 2].str.strip()
+    years, level = sheet_name.rsplit(" ", 1)
+    out = pd.DataFrame({
+        "School Year": np.int32(years.split("-")[-1]),
+        "Unit": "school",
+        "District": district.str.upper().replace(METRO_DISTRICTS),
+        "School Name": df["School Name"].str.strip().str.upper(),
+        "School Level": level,
+        "Grade": df["Grades"].astype("string"),
+        "Source": source,
+    })
+    for race, col in METRO_RACES.items():
+        out[race] = _counts(df[col])
+    out["Pacific Islander"] = pd.array([0] * len(out), dtype="Int32")
+    return out
+
+
+def normalize_sheet(df, source, sheet_name):
+    # Pick the layout from the columns; None for sheets without race counts
+    # (grade totals, district comparisons, state summaries, exports)
+    cols = set(df.columns)
+    if set(GENDER_COLS) <= cols and {"School Code", "School Year"} <= cols:
+        out = _school_grades(df, source)
+    elif {"YEAR", "DISTRICT_NAME"} <= cols:
+        out = _district_demographics(df, source)
+    elif {"AAPI", "School Name"} <= cols and re.match(r"\d{4}-\d{4} ", str(sheet_name)):
+        out = _metro_schools(df, source, sheet_name)
+    else:
+        return None
+    return out.reindex(columns=INGEST_COLS)
+
+
+def _ingest_sheet(task):
+    path, sheet_name = task
+    return normalize_sheet(load_sheet(path, sheet_name), os.path.basename(path), sheet_name)
+
+
+def workbook_paths(source):
+    # A directory of workbooks, a manifest file (one path per line, relative
+    # to the manifest), a single workbook, or a list of paths
+    if isinstance(source, (list, tuple)):
+        return list(source)
+    if os.path.isdir(source):
+        return sorted(p for p in glob.glob(os.path.join(source, "*.xlsx"))
+                      if not os.path.basename(p).startswith("~$"))
+    if source.endswith(".xlsx"):
+        return [source]
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        lines = [line.strip() for line in f]
+    return [os.path.join(base, line) for line in lines if line and not line.startswith("#")]
+
+
+def ingest(source, max_workers=None):
+    # Parse every sheet of every workbook in a process pool and stack the
+    # normalized rows into one dataset indexed by School Year
+    tasks = [(path, sheet) for path in workbook_paths(source)
+             for sheet in pd.ExcelFile(path).sheet_names]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        parts = [part for part in pool.map(_ingest_sheet, tasks) if part is not None and len(part)]
+    data = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=INGEST_COLS)
+    # Footer rows (grand totals) carry no year
+    data = data.dropna(subset=["School Year"]).astype(INGEST_DTYPES)
+    return data.set_index("School Year").sort_index(kind="stable")
@@ -0,0 +1,125 @@
+import pandas as pd
+
+from engine import (FORMATS, KINDS, OKC_METRO_DISTRICTS, SCHOOL_COLS, Dataset, EngineError, average, export,
+                    rank, schools, search)
+from profiling import stage
+from views import MIN_TOTAL
+
+PLURALS = {"county": "counties", "district": "districts", "school": "schools"}
+
+
+class Menu:
+    # The interactive loop behind the BasicTestEquations scripts. A script
+    # names its workbook and the options it offers; loading, searching,
+    # ranking and exporting all go through engine, once for every script.
+    # Each action is timed as a menu/... stage once its prompts are
+    # answered, so time spent typing is left out (exports time the hand-off;
+    # the write itself is the export stage on the writer thread).
+
+    def __init__(self, workbook, title, place="County"):
+        self.data = Dataset(workbook)
+        self.title = title
+        # Column shown next to the school name in rankings
+        self.place = place
+        # The last table shown, for "export current view"
+        self.current = pd.DataFrame()
+
+    def choose(self, kind, action="view"):
+        # Id of one matching name, asking which when several match
+        text = input(f"Enter {kind} name (or part of it): ").strip()
+        ids = search(self.data, kind, text)
+        if len(ids) == 0:
+            print(f"No {PLURALS[kind]} match '{text}'.")
+            return None
+        if len(ids) == 1:
+            return ids[0]
+        print(f"Matching {PLURALS[kind]} found:")
+        for i, name in enumerate(self.data.index(kind).names[ids]):
+            print(f"{i + 1}. {name}")
+        selection = int(input(f"Enter the number of the {kind} to {action} (1-{len(ids)}): "))
+        if not 1 <= selection <= len(ids):
+            raise ValueError(selection)
+        return ids[selection - 1]
+
+    def show(self, kind, min_total=MIN_TOTAL, head=30):
+        # Schools of a county or district (or matching a school name);
+        # min_total None shows every school
+        name_id = self.choose(kind)
+        if name_id is None:
+            return
+        with stage(f"menu/show/{kind}"):
+            self.current = schools(self.data, kind, name_id, min_total)
+            cols = SCHOOL_COLS if kind == "school" else ["School Name", KINDS[kind], "total", "simpson", "entropy"]
+            print(self.current[cols].head(head))
+
+    def ranking(self, heading, metric, k, bottom=False, min_total=MIN_TOTAL):
+        with stage(f"menu/{'bottom' if bottom else 'top'}/{metric}"):
+            ranked, _ = rank(self.data, metric, k, bottom, min_total)
+            self.current = self.data.views.filter(min_total=min_total)
+            print(f"\n{heading}:")
+            print(ranked[["School Name", self.place, metric]])
+
+    def average(self, kind, min_total=MIN_TOTAL):
+        name_id = self.choose(kind, "analyze")
+        if name_id is None:
+            return
+        with stage(f"menu/average/{kind}"):
+            label = self.data.index(kind).names[name_id]
+            self.current = schools(self.data, kind, name_id, min_total)
+            counted, simpson = average(self.data, kind, name_id, min_total)
+            if counted == 0:
+                print(f"No valid schools in {kind} '{label}' after filtering.")
+            else:
+                print(f"Average Simpson Diversity Index for '{label}': {simpson:.4f}")
+
+    def _export(self, table, what):
+        file_name = input("Enter the filename to save (without extension): ").strip()
+        file_type = input("Enter file type: CSV, Parquet or Excel (csv/parquet/xlsx): ").strip().lower()
+        if file_type not in FORMATS:
+            print("Unsupported file type. Please enter 'csv', 'parquet' or 'xlsx'.")
+            return
+        path = f"{file_name}.{FORMATS[file_type]}"
+        with stage("menu/export", rows=len(table)):
+            export(table, path, file_type, background=True)
+        print(f"Exporting {what} to {path} in the background...")
+
+    def export_view(self):
+        if self.current.empty:
+            print("No data available to export. Please view a report first (e.g., county or district).")
+            return
+        self._export(self.current, "the current view")
+
+    def export_all(self):
+        self._export(self.data.grouped, "all data")
+
+    def export_districts(self, districts=OKC_METRO_DISTRICTS):
+        # First sheet has every matching school, then one sheet per district
+        file_name = input("Enter the filename to save (without extension): ").strip()
+        path = f"{file_name}.xlsx"
+        try:
+            with stage("menu/export/districts"):
+                export(self.data.grouped, path, "xlsx", districts, background=True)
+        except EngineError as e:
+            print(e)
+            return
+        print(f"Exporting the districts to {path} in the background...")
+
+    def run(self, options):
+        # options: (label, action) in menu order; an action of None exits
+        while True:
+            print(f"\n{self.title}")
+            for i, (label, _) in enumerate(options, start=1):
+                print(f"{i}. {label}")
+            choice = input(f"\nEnter your choice (1-{len(options)}): ").strip()
+            if not choice.isdigit() or not 1 <= int(choice) <= len(options):
+                print(f"Invalid choice. Please select 1-{len(options)}.")
+                continue
+            action = options[int(choice) - 1][1]
+            if action is None:
+                print("Exiting program. Goodbye!")
+                break
+            try:
+                action()
+            except ValueError:
+                print("Invalid selection.")
+
@@ -0,0 +1,147 @@
+import numpy as np
+
+from data_cache import RACE_COLS
+
+# name -> function(view) giving one value per row of the view
+REGISTRY = {}
+
+# Metrics whose value for a school depends on the other schools in the view
+# (contributions to a view-wide index); never read from a stored column
+PER_VIEW = set()
+
+
+def register(name, per_view=False):
+    def wrap(fn):
+        REGISTRY[name] = fn
+        if per_view:
+            PER_VIEW.add(name)
+        return fn
+    return wrap
+
+
+def metric_names():
+    # Every column-shaped metric, for menus and argument choices
+    return [name for name in REGISTRY if not name.startswith("_")]
+
+
+class MetricView:
+    # Some rows of a school table (all by default) whose metrics are worked
+    # out the first time they are asked for, for those rows only, and kept
+    # for the life of the view. Metrics already stored in the table (total,
+    # simpson, entropy from metrics_table) are read instead of recomputed.
+
+    def __init__(self, table, rows=None):
+        self.table = table
+        self.rows = np.arange(len(table)) if rows is None else np.asarray(rows)
+        self._values = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, name):
+        return name in REGISTRY or name in self.table.columns
+
+    def __getitem__(self, name):
+        if name not in self._values:
+            if name in self.table.columns and name not in PER_VIEW:
+                self._values[name] = self.table[name].to_numpy()[self.rows]
+            elif name in REGISTRY:
+                self._values[name] = REGISTRY[name](self)
+            else:
+                raise KeyError(f"unknown metric {name!r}")
+        return self._values[name]
+
+    def computed(self):
+        return list(self._values)
+
+    def frame(self, metrics, columns=None):
+        # The view's rows of table[columns] with the metrics alongside
+        out = self.table.iloc[self.rows]
+        out = out if columns is None else out[columns]
+        return out.assign(**{name: self[name] for name in metrics if name not in out.columns})
+
+
+@register("_counts")
+def _counts(view):
+    return view.table[RACE_COLS].to_numpy(dtype=np.float64)[view.rows]
+
+
+@register("total")
+def _total(view):
+    return view["_counts"].sum(axis=1)
+
+
+@register("_shares")
+def _shares(view):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return view["_counts"] / view["total"][:, None]
+
+
+def _share(i):
+    return lambda view: view["_shares"][:, i]
+
+
+for _i, _race in enumerate(RACE_COLS):
+    register(f"p_{_race}")(_share(_i))
+
+
+@register("simpson")
+def _simpson(view):
+    return 1 - (view["_shares"] ** 2).sum(axis=1)
+
+
+@register("entropy")
+def _entropy(view):
+    p = view["_shares"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        plogp = np.where(p > 0, p * np.log(p), 0.0)
+    return np.where(view["total"] > 0, -plogp.sum(axis=1), np.nan)
+
+
+@register("_pooled")
+def _pooled(view):
+    # The whole view as one school: (total, shares, simpson, entropy)
+    counts = view["_counts"].sum(axis=0)
+    total = counts.sum()
+    p = counts / total if total > 0 else np.full(len(counts), np.nan)
+    nz = p[p > 0]
+    return total, p, 1 - (p * p).sum(), -(nz * np.log(nz)).sum()
+
+
+@register("theil", per_view=True)
+def _theil(view):
+    # Each school's share of the view's Theil H; they add up to H
+    T, _, _, E = view["_pooled"]
+    e = np.nan_to_num(view["entropy"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return view["total"] * (E - e) / (T * E)
+
+
+@register("dissimilarity", per_view=True)
+def _dissimilarity(view):
+    # Each school's share of the view's multigroup D; they add up to D
+    T, P, I, _ = view["_pooled"]
+    gap = np.abs(np.nan_to_num(view["_shares"]) - P).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return view["total"] * gap / (2 * T * I)
+
+
+def _isolation(i):
+    # School's part of the view's isolation index for race i: the chance
+    # that a race-i student's schoolmate is also race i, weighted by how many
+    # of the view's race-i students attend it
+    def fn(view):
+        counts = view["_counts"][:, i]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return counts / counts.sum() * np.nan_to_num(view["_shares"][:, i])
+    return fn
+
+
+for _i, _race in enumerate(RACE_COLS):
+    register(f"isolation_{_race}", per_view=True)(_isolation(_i))
+
+
+def attach_metrics(table, metrics):
+    # Copy of table with the named metrics added as columns
+    return MetricView(table).frame(metrics)
+
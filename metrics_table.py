@@ -0,0 +1,195 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_cache import (GENDER_COLS, NAME_COLS, RACE_COLS, feather, cache_path, load_sheet,
+                        read_meta, source_digest, write_meta)
+from profiling import stage, timed
+from segregation import count_matrix, diversity, group_sum, grouping
+
+# A school is identified by its district and site code, not by its name
+# ("LINCOLN ES" exists in several districts)
+KEY_COLS = ["District Code", "School Code"]
+
+# Everything that feeds a school's metrics. School Year and the Total columns
+# are left out so an unchanged school hashes the same in every release.
+FINGERPRINT_COLS = ["School Name", "District", "County", "Grade"] + GENDER_COLS
+
+# Proportions are not stored; with_proportions adds them when needed
+P_COLS = [f"p_{col}" for col in RACE_COLS]
+
+# Bump this when the stored table's columns or dtypes change
+METRICS_VERSION = 3
+
+
+@timed("metrics")
+def add_metrics(table):
+    # Race counts -> total, Simpson and Shannon entropy
+    total, _, simpson, entropy = diversity(count_matrix(table))
+    table["total"] = total.astype(np.int32)
+    table["simpson"] = simpson
+    table["entropy"] = entropy
+    return table
+
+
+def with_proportions(table):
+    # Copy of table with p_<race> columns after the race counts
+    if not set(RACE_COLS) <= set(table.columns) or set(P_COLS) <= set(table.columns):
+        return table
+    _, p, _, _ = diversity(count_matrix(table))
+    at = max(table.columns.get_loc(col) for col in RACE_COLS) + 1
+    props = pd.DataFrame(p, index=table.index, columns=P_COLS)
+    return pd.concat([table.iloc[:, :at], props, table.iloc[:, at:]], axis=1)
+
+
+# splitmix64 finalizer constants; the fingerprint mixes are plain uint64
+# arithmetic, so hashing costs far less than the aggregation it can skip
+_MIX = (np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB))
+_STEP = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(h):
+    h = h ^ (h >> np.uint64(30))
+    h = h * _MIX[0]
+    h = h ^ (h >> np.uint64(27))
+    h = h * _MIX[1]
+    return h ^ (h >> np.uint64(31))
+
+
+def _column_hash(col):
+    # One uint64 per row from the column's values. Categories are hashed
+    # once each, not once per row; numbers are used as they are.
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        categories = pd.util.hash_array(col.cat.categories.astype(str).to_numpy(dtype=object),
+                                        categorize=False)
+        codes = col.cat.codes.to_numpy()
+        return np.where(codes >= 0, categories[codes], np.uint64(0))
+    if pd.api.types.is_numeric_dtype(col.dtype):
+        return col.to_numpy(dtype=np.int64, na_value=-1).astype(np.uint64)
+    return pd.util.hash_array(col.astype(str).to_numpy(dtype=object), categorize=False)
+
+
+def _row_hash(frame, cols):
+    # Each column's values times its own odd 64-bit constant, summed, then
+    # mixed once per row. Numeric columns are read as one block.
+    numeric = [col for col in cols if pd.api.types.is_numeric_dtype(frame[col].dtype)
+               and not isinstance(frame[col].dtype, pd.CategoricalDtype)]
+    block = frame[numeric].to_numpy(dtype=np.int64, na_value=-1).astype(np.uint64) if numeric else None
+    with np.errstate(over="ignore"):
+        weights = _mix(np.arange(1, len(cols) + 1, dtype=np.uint64) * _STEP) | np.uint64(1)
+        h = np.zeros(len(frame), dtype=np.uint64)
+        for col, weight in zip(cols, weights):
+            values = block[:, numeric.index(col)] if col in numeric else _column_hash(frame[col])
+            h += values * weight
+        return _mix(h)
+
+
+def school_keys(frame):
+    # One uint64 per row naming its school (District Code + School Code),
+    # the same in every release and for raw rows and table rows alike
+    return _row_hash(frame, KEY_COLS)
+
+
+@timed("aggregate/fingerprints")
+def school_fingerprints(raw):
+    # (sorted school keys, fingerprint of each, school of each raw row). A
+    # fingerprint is the school key mixed with the wrapped sum of its row
+    # hashes, so equal fingerprints mean the same school with the same rows.
+    schools, inverse = np.unique(school_keys(raw), return_inverse=True)
+    sums = np.zeros(len(schools), dtype=np.uint64)
+    np.add.at(sums, inverse, _row_hash(raw, FINGERPRINT_COLS))
+    with np.errstate(over="ignore"):
+        return schools, _mix(schools * _STEP + sums), inverse
+
+
+def aggregate_schools(raw, schools=None):
+    # Grade rows -> one row of race counts per school, in order of first
+    # appearance. schools is each row's school as 0..n-1 codes, when the
+    # caller already has them (build_metrics_table does).
+    with stage("aggregate", rows=len(raw)):
+        if schools is None:
+            schools = raw.groupby(KEY_COLS, sort=False, observed=True).ngroup().to_numpy()
+        groups = grouping(schools, int(schools.max()) + 1 if len(schools) else 0)
+        order, starts = groups[0], groups[1]
+        gender = group_sum(raw[GENDER_COLS].to_numpy(dtype=np.int64), groups)
+        races = gender.reshape(len(gender), len(RACE_COLS), 2).sum(axis=2)
+        first = np.minimum.reduceat(order, starts) if len(order) else order
+        table = raw.iloc[first][["School Name", "District", "County"] + KEY_COLS].reset_index(drop=True)
+        table[RACE_COLS] = races.astype(np.int32)
+        table = table.iloc[np.argsort(first, kind="stable")].reset_index(drop=True)
+    return add_metrics(table)
+
+
+def build_metrics_table(raw, previous=None):
+    # Metrics for every school in raw. With a previous table (same sheet
+    # before an edit, or last year's release) only schools whose rows changed
+    # are aggregated again; the rest are copied over.
+    raw = raw.dropna(subset=KEY_COLS)
+    schools, fingerprints, row_school = school_fingerprints(raw)
+
+    if previous is None or "fingerprint" not in previous.columns:
+        table = aggregate_schools(raw, row_school)
+        table["fingerprint"] = fingerprints[np.searchsorted(schools, school_keys(table))]
+    else:
+        # Change detection is a few hash comparisons; only the changed
+        # schools' rows go through the groupby
+        seen = previous["fingerprint"].to_numpy(dtype=np.uint64)
+        kept = np.isin(seen, fingerprints)
+        changed = ~np.isin(fingerprints, seen)
+        if not changed.any() and kept.all():
+            return previous.copy()
+        parts = [previous[kept]]
+        # A release that only drops schools has nothing to aggregate
+        if changed.any():
+            rows = changed[row_school]
+            fresh = aggregate_schools(raw[rows], np.unique(row_school[rows], return_inverse=True)[1])
+            fresh["fingerprint"] = fingerprints[np.searchsorted(schools, school_keys(fresh))]
+            parts.append(fresh[previous.columns])
+        table = pd.concat(parts, ignore_index=True)
+
+    table = table.sort_values(["School Name"] + KEY_COLS, ignore_index=True)
+    # Merged tables lose their categories; rebuild them from what is left
+    for col in NAME_COLS + ["District Code"]:
+        if isinstance(table[col].dtype, pd.CategoricalDtype):
+            table[col] = table[col].cat.remove_unused_categories()
+        else:
+            table[col] = table[col].astype("string").astype("category")
+    return table[["School Name", "total", "District", "County"] + KEY_COLS
+                 + RACE_COLS + ["simpson", "entropy", "fingerprint"]]
+
+
+@timed("metrics/cache")
+def _read_table(arrow_path):
+    return feather.read_table(arrow_path, memory_map=True).to_pandas()
+
+
+def metrics_table(path, sheet_name=0, previous=None):
+    # Per-school metrics for a release, computed once and persisted next to
+    # the sheet cache. previous may name an earlier release workbook whose
+    # table seeds an incremental refresh.
+    if feather is None:
+        return build_metrics_table(load_sheet(path, sheet_name)).drop(columns="fingerprint")
+
+    arrow_path = cache_path(path, sheet_name, ".metrics.arrow")
+    meta_path = cache_path(path, sheet_name, ".metrics.json")
+    digest = source_digest(path, sheet_name)
+    meta = read_meta(meta_path)
+    have_table = (meta is not None and meta.get("version") == METRICS_VERSION
+                  and os.path.exists(arrow_path))
+
+    if have_table and meta["sha1"] == digest:
+        return _read_table(arrow_path).drop(columns="fingerprint")
+
+    base = None
+    if previous is not None:
+        metrics_table(previous)
+        base = _read_table(cache_path(previous, 0, ".metrics.arrow"))
+    elif have_table:
+        base = _read_table(arrow_path)
+
+    table = build_metrics_table(load_sheet(path, sheet_name), base)
+    feather.write_feather(table, arrow_path, compression="uncompressed")
+    write_meta(meta_path, {"version": METRICS_VERSION, "source": os.path.basename(path),
+                           "sheet": str(sheet_name), "sha1": digest})
+    return table.drop(columns="fingerprint")
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+from profiling import timed
+
+# Fuzzy matches below this trigram similarity are treated as noise
+FUZZY_CUTOFF = 0.4
+
+
+def normalize(text):
+    # "  Putnam   City " -> "putnam city"
+    return " ".join(str(text).lower().split())
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class NameIndex:
+    # Built once per column at load time. Every distinct (normalized) name
+    # gets an id; ids follow alphabetical order, so results come out sorted.
+    #   contains trigram postings intersected, then confirmed with `in`
+    #   fuzzy    names ranked by shared trigrams, for typos
+
+    @timed("search/build_index")
+    def __init__(self, labels):
+        labels = pd.Series(labels, copy=False).reset_index(drop=True)
+        keys = labels.dropna().map(normalize)
+        codes, self.keys = pd.factorize(keys, sort=True)
+        self.keys = list(self.keys)
+
+        # Show each name the way it is written in the data
+        row_ids = keys.index.to_numpy()
+        first = np.unique(codes, return_index=True)[1]
+        self.names = labels.iloc[row_ids[first]].to_numpy()
+
+        order = np.argsort(codes, kind="stable")
+        self._rows = row_ids[order]
+        self._starts = np.searchsorted(codes[order], np.arange(len(self.keys) + 1))
+
+        postings = {}
+        self._sizes = np.empty(len(self.keys), dtype=np.int32)
+        for i, key in enumerate(self.keys):
+            grams = trigrams(f" {key} ")
+            self._sizes[i] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self._postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def rows(self, name_ids):
+        # Row positions (iloc) of every row carrying these names, in table order
+        ids = np.atleast_1d(name_ids)
+        if len(ids) == 0:
+            return self._rows[:0]
+        if len(ids) == 1:
+            return self._rows[self._starts[ids[0]]:self._starts[ids[0] + 1]]
+        return np.sort(np.concatenate([self._rows[self._starts[i]:self._starts[i + 1]] for i in ids]))
+
+    def contains(self, query):
+        query = normalize(query)
+        grams = trigrams(query)
+        if not grams:
+            # Too short for a trigram; there are only a few thousand names
+            candidates = range(len(self.keys))
+        else:
+            lists = sorted((self._postings.get(g, ()) for g in grams), key=len)
+            candidates = lists[0]
+            for ids in lists[1:]:
+                if not len(candidates):
+                    break
+                candidates = np.intersect1d(candidates, ids, assume_unique=True)
+        return np.array([i for i in candidates if query in self.keys[i]], dtype=np.int32)
+
+    def fuzzy(self, query, limit=10, cutoff=FUZZY_CUTOFF):
+        # Share of the query's trigrams found in each name, best first; ties
+        # go to the name with fewer extra trigrams. Only the front is padded
+        # so a partial name still matches the start of a longer one.
+        grams = trigrams(f" {normalize(query)}")
+        hits = [self._postings[g] for g in grams if g in self._postings]
+        if not hits:
+            return np.array([], dtype=np.int32)
+        shared = np.bincount(np.concatenate(hits), minlength=len(self.keys))
+        score = shared / len(grams)
+        best = np.flatnonzero(score >= cutoff)
+        best = best[np.lexsort((self._sizes[best], -score[best]))][:limit]
+        return best.astype(np.int32)
+
+    @timed("search")
+    def search(self, query):
+        # Substring matches, or the closest spellings when nothing contains it
+        ids = self.contains(query)
+        return ids if len(ids) else self.fuzzy(query)
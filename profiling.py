@@ -0,0 +1,155 @@
+import atexit
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+# Off unless asked for, either by environment variable or by a --profile
+# flag that calls enable():
+#   DIVERSITY_PROFILE=log       one JSON line per timed stage, a summary at exit
+#   DIVERSITY_PROFILE=cprofile  the same plus a cProfile dump (pstats file)
+#   DIVERSITY_PROFILE_FILE      where the JSON lines go (default stderr)
+ENV_VAR = "DIVERSITY_PROFILE"
+FILE_VAR = "DIVERSITY_PROFILE_FILE"
+MODES = ["log", "cprofile"]
+# Values of DIVERSITY_PROFILE that leave profiling off
+OFF_VALUES = ["", "0", "off", "false", "no"]
+PSTATS_FILE = "diversity.prof"
+
+_mode = None
+_out = None
+_profiler = None
+_lock = threading.Lock()
+# stage -> [calls, seconds, rows (None if never counted)]
+_totals = {}
+
+
+class _Stage:
+    __slots__ = ("name", "rows", "start")
+
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _record(self.name, time.perf_counter() - self.start, self.rows, exc_type)
+        return False
+
+
+class _Off:
+    # Shared stand-in while profiling is off; setting .rows on it is harmless
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_OFF = _Off()
+
+
+def enabled():
+    return _mode is not None
+
+
+def stage(name, rows=None):
+    # Time a block; rows is how many rows it touched, known up front or set
+    # inside: with stage("aggregate", rows=len(raw)) as s: ...
+    return _Stage(name, rows) if _mode is not None else _OFF
+
+
+def _count(result):
+    shape = getattr(result, "shape", None)
+    if shape:
+        return int(shape[0])
+    return result if isinstance(result, int) and not isinstance(result, bool) else None
+
+
+def timed(name, rows=_count):
+    # Decorator form of stage(); rows(result) gives the row count
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if _mode is None:
+                return fn(*args, **kwargs)
+            with _Stage(name, None) as s:
+                result = fn(*args, **kwargs)
+                s.rows = rows(result)
+            return result
+        return inner
+    return wrap
+
+
+def _record(name, seconds, rows, exc_type=None):
+    entry = {"stage": name, "seconds": round(seconds, 6), "rows": rows,
+             "thread": threading.current_thread().name, "ts": round(time.time(), 3)}
+    if exc_type is not None:
+        entry["error"] = exc_type.__name__
+    with _lock:
+        total = _totals.setdefault(name, [0, 0.0, None])
+        total[0] += 1
+        total[1] += seconds
+        if rows is not None:
+            total[2] = (total[2] or 0) + rows
+        _out.write(json.dumps(entry) + "\n")
+        _out.flush()
+
+
+def enable(mode="log", output=None, pstats_file=PSTATS_FILE):
+    # Start recording; safe to call more than once (later calls are ignored)
+    global _mode, _out, _profiler
+    if _mode is not None:
+        return
+    if mode not in MODES:
+        raise ValueError(f"profile mode must be one of {MODES}, not {mode!r}")
+    _mode = mode
+    _out = open(output, "a") if output else sys.stderr
+    if mode == "cprofile":
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    atexit.register(_finish, pstats_file)
+
+
+def summary():
+    # (stage, calls, total seconds, rows) rows, slowest stage first
+    with _lock:
+        items = [(name, calls, seconds, rows) for name, (calls, seconds, rows) in _totals.items()]
+    return sorted(items, key=lambda item: -item[2])
+
+
+def _finish(pstats_file):
+    items = summary()
+    if items:
+        print("\nstage                                calls     total s      rows", file=sys.stderr)
+        for name, calls, seconds, rows in items:
+            print(f"{name:36} {calls:6} {seconds:11.4f} {'-' if rows is None else rows:>9}", file=sys.stderr)
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(pstats_file)
+        print(f"\ncProfile written to {pstats_file}; top functions by cumulative time:", file=sys.stderr)
+        pstats.Stats(pstats_file, stream=sys.stderr).sort_stats("cumulative").print_stats(20)
+    if _out is not None and _out is not sys.stderr:
+        _out.close()
+
+
+def _from_env():
+    value = os.environ.get(ENV_VAR, "").strip().lower()
+    if value in OFF_VALUES:
+        return
+    if value not in MODES:
+        print(f"warning: ignoring {ENV_VAR}={os.environ[ENV_VAR]!r}; use one of {MODES}", file=sys.stderr)
+        return
+    enable(value, os.environ.get(FILE_VAR))
+
+
+_from_env()
@@ -0,0 +1,145 @@
+import math
+
+import numpy as np
+
+from segregation import count_matrix, diversity, group_codes, group_sum, grouping
+
+# Plan-level scores a chain can push up or down:
+#   dissimilarity  multigroup D between districts
+#   theil          multigroup information index H between districts
+#   simpson        mean Simpson index of the districts
+OBJECTIVES = ["dissimilarity", "theil", "simpson"]
+
+
+def _stats(c, P):
+    # Total, Simpson, entropy and the |c - T*P| dissimilarity term of one
+    # district's race counts; O(races)
+    T = c.sum()
+    if T <= 0:
+        return 0.0, 0.0, 0.0, 0.0
+    p = c / T
+    nz = p[p > 0]
+    return T, 1.0 - (p * p).sum(), -(nz * np.log(nz)).sum(), np.abs(c - T * P).sum()
+
+
+class DistrictPlan:
+    # Schools assigned to districts, with each district's race count vector
+    # kept up to date. Moving one school touches two districts, so scores
+    # update in O(races) instead of regrouping every school.
+
+    def __init__(self, counts, assignment, n_districts=None):
+        self.counts = np.ascontiguousarray(counts, dtype=np.float64)
+        self.assignment = np.array(assignment, dtype=np.intp)
+        n = int(self.assignment.max()) + 1 if n_districts is None else n_districts
+        self.district_counts = group_sum(self.counts, grouping(self.assignment, n))
+
+        # State-wide total, proportions, Simpson and entropy
+        self.T, self.P, self.I, self.E = (v[0] for v in diversity(self.counts.sum(axis=0)[None, :]))
+        self.total, _, self.simpson, self.entropy = diversity(self.district_counts)
+        self.simpson = np.nan_to_num(self.simpson)
+        self.entropy = np.nan_to_num(self.entropy)
+        self.dterm = np.abs(self.district_counts - self.total[:, None] * self.P).sum(axis=1)
+        self._sums = np.array([self.dterm.sum(), (self.total * self.entropy).sum(), self.simpson.sum()])
+
+    @property
+    def n_districts(self):
+        return len(self.total)
+
+    def _score(self, sums, objective):
+        dterm, te, simpson = sums
+        if objective == "dissimilarity":
+            return dterm / (2 * self.T * self.I)
+        if objective == "theil":
+            return 1 - te / (self.T * self.E)
+        if objective == "simpson":
+            return simpson / self.n_districts
+        raise ValueError(f"unknown objective {objective!r}; expected one of {OBJECTIVES}")
+
+    def score(self, objective="dissimilarity"):
+        return self._score(self._sums, objective)
+
+    def _proposal(self, school, district):
+        # New stats of the two districts involved and the plan sums after
+        # the move, without applying it
+        src = self.assignment[school]
+        x = self.counts[school]
+        new_src = _stats(self.district_counts[src] - x, self.P)
+        new_dst = _stats(self.district_counts[district] + x, self.P)
+        sums = self._sums.copy()
+        for d, (T, s, e, dt) in ((src, new_src), (district, new_dst)):
+            sums += (dt - self.dterm[d], T * e - self.total[d] * self.entropy[d], s - self.simpson[d])
+        return src, new_src, new_dst, sums
+
+    def delta(self, school, district, objective="dissimilarity"):
+        # Change in score if school moved to district
+        if district == self.assignment[school]:
+            return 0.0
+        sums = self._proposal(school, district)[3]
+        return self._score(sums, objective) - self.score(objective)
+
+    def move(self, school, district, proposal=None):
+        if district == self.assignment[school]:
+            return
+        src, new_src, new_dst, sums = proposal or self._proposal(school, district)
+        x = self.counts[school]
+        self.district_counts[src] -= x
+        self.district_counts[district] += x
+        for d, (T, s, e, dt) in ((src, new_src), (district, new_dst)):
+            self.total[d], self.simpson[d], self.entropy[d], self.dterm[d] = T, s, e, dt
+        self._sums = sums
+        self.assignment[school] = district
+
+
+def plan_from_table(table, level="District"):
+    # DistrictPlan of a per-school table (metrics_table output or the
+    # gerrymander workbook) plus the district name of each code
+    codes, names = group_codes(table[level].to_numpy())
+    return DistrictPlan(count_matrix(table), codes, len(names)), names
+
+
+def flip_chain(plan, steps, objective="dissimilarity", maximize=True, temperature=0.0,
+               tolerance=0.1, regions=None, seed=None):
+    # Single-school flip chain. Each step moves a random school to a random
+    # district of its region (by default any district) and keeps the move if
+    # it improves the score, or with Metropolis probability when temperature
+    # > 0. Districts must stay within +-tolerance of their starting
+    # enrollment. The plan is left at the last state; the best assignment
+    # seen is returned with the score trace.
+    rng = np.random.default_rng(seed)
+    sign = 1.0 if maximize else -1.0
+    low, high = plan.total * (1 - tolerance), plan.total * (1 + tolerance)
+
+    if regions is None:
+        options = [np.arange(plan.n_districts)]
+        region_of = np.zeros(len(plan.assignment), dtype=np.intp)
+    else:
+        region_of, _ = group_codes(regions)
+        pairs = np.unique(np.c_[region_of, plan.assignment], axis=0)
+        starts = np.searchsorted(pairs[:, 0], np.arange(region_of.max() + 2))
+        options = [pairs[starts[r]:starts[r + 1], 1] for r in range(region_of.max() + 1)]
+
+    schools = rng.integers(len(plan.assignment), size=steps)
+    picks = rng.random(steps)
+    accepts = rng.random(steps)
+    x_total = plan.counts.sum(axis=1)
+
+    current = plan.score(objective)
+    best, best_assignment = current, plan.assignment.copy()
+    trace = np.empty(steps)
+    accepted = 0
+    for i in range(steps):
+        s = schools[i]
+        choices = options[region_of[s]]
+        dst = choices[int(picks[i] * len(choices))]
+        src = plan.assignment[s]
+        if dst != src and plan.total[src] - x_total[s] >= low[src] and plan.total[dst] + x_total[s] <= high[dst]:
+            proposal = plan._proposal(s, dst)
+            gain = sign * (plan._score(proposal[3], objective) - current)
+            if gain >= 0 or (temperature > 0 and accepts[i] < math.exp(gain / temperature)):
+                plan.move(s, dst, proposal)
+                current += sign * gain
+                accepted += 1
+                if sign * (current - best) > 0:
+                    best, best_assignment = current, plan.assignment.copy()
+        trace[i] = current
+    return {"best_score": best, "best_assignment": best_assignment, "trace": trace, "accepted": accepted}
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+from data_cache import RACE_COLS
+from name_index import normalize
+from segregation import count_matrix, group_codes, group_indices, group_sum, grouping
+
+# School -> District -> County -> Metro -> State. Metro is made of custom
+# district groups, so a school outside every group has no Metro row, and a
+# group none of the table's schools belong to (any workbook without the OKC
+# districts) gets a row of zero counts and NaN metrics.
+LEVELS = ["School", "District", "County", "Metro", "State"]
+
+# The 23 Oklahoma City metro districts (OKC Metro.xlsx spells Mid-Del as
+# MIDDEL; the state grids spell it out)
+OKC_METRO_DISTRICTS = ["Choctaw-Nicoma Park", "Jones", "Moore", "Millwood", "Yukon", "Putnam City",
+                       "Deer Creek", "Western Heights", "Oklahoma City", "Luther", "McLoud", "Crooked Oak",
+                       "Banner", "Little Axe", "Norman", "Midwest City-Del City", "Robin Hill", "Crutcho",
+                       "Oakdale", "Piedmont", "Mustang", "Edmond", "Bethany"]
+
+# Metro group name -> its districts
+METRO_GROUPS = {"OKC Metro": OKC_METRO_DISTRICTS}
+
+# Columns of every level frame after the name (and parent) columns:
+#   schools                    schools counted in the means
+#   total, <race>, simpson,    the level's pooled counts and the diversity
+#   entropy                    of all its students taken together
+#   theil, dissimilarity       between-school segregation inside it
+#   mean_simpson/entropy       unweighted mean over its schools
+#   weighted_simpson/entropy   the same weighted by enrollment
+MEAN_COLS = ["mean_simpson", "mean_entropy", "weighted_simpson", "weighted_entropy"]
+
+
+class Rollups:
+    # Every level of a school table materialized in one pass per level:
+    # integer codes, one group_sum for the means, one group_indices for the
+    # pooled metrics. Lookups by name are dictionary reads afterwards.
+    #
+    # Pooled counts take every school; the means take only the schools in
+    # mask (the rankings' filter: no Epic, above MIN_TOTAL), matching what
+    # the district and county averages have always reported.
+
+    def __init__(self, table, mask=None, groups=METRO_GROUPS):
+        self.table = table
+        counts = count_matrix(table)
+        mask = np.ones(len(table), dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        simpson = np.nan_to_num(table["simpson"].to_numpy(dtype=np.float64))
+        entropy = np.nan_to_num(table["entropy"].to_numpy(dtype=np.float64))
+        total = table["total"].to_numpy(dtype=np.float64)
+        w = mask * total
+        # Per school: [counted, simpson, entropy, weight, weight*simpson, weight*entropy]
+        sums = np.column_stack([mask, mask * simpson, mask * entropy, w, w * simpson, w * entropy])
+
+        self.frames = {"School": table}
+        for level in ["District", "County"]:
+            codes, names = group_codes(table[level].astype(object).to_numpy())
+            self.frames[level] = _level_frame(level, names, counts, sums, codes)
+        self.frames["District"].insert(1, "County", _parent(table, "District", "County", self.frames["District"]))
+
+        rows, codes = _metro_rows(table, groups)
+        self.frames["Metro"] = _level_frame("Metro", pd.Index(list(groups)), counts[rows], sums[rows], codes)
+        state = np.zeros(len(table), dtype=np.intp)
+        self.frames["State"] = _level_frame("State", pd.Index(["STATE"]), counts, sums, state)
+
+        self._lookup = {level: {normalize(name): i for i, name in enumerate(frame[level])}
+                        for level, frame in self.frames.items() if level != "School"}
+
+    def frame(self, level):
+        if level not in self.frames:
+            raise KeyError(f"level must be one of {LEVELS}, not {level!r}")
+        return self.frames[level]
+
+    def get(self, level, name):
+        # One district, county, metro group (or "STATE") as a Series; None if
+        # the level has no such name
+        if level not in self._lookup:
+            raise KeyError(f"level must be one of {LEVELS[1:]}, not {level!r}")
+        i = self._lookup[level].get(normalize(name))
+        return None if i is None else self.frames[level].iloc[i]
+
+
+def _level_frame(level, names, counts, sums, codes):
+    n = len(names)
+    r = group_indices(counts, codes, n)
+    s = group_sum(sums, grouping(codes, n))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = np.column_stack([s[:, 1] / s[:, 0], s[:, 2] / s[:, 0], s[:, 4] / s[:, 3], s[:, 5] / s[:, 3]])
+    frame = pd.DataFrame(r["counts"].astype(np.int64), columns=RACE_COLS)
+    frame.insert(0, level, np.asarray(names, dtype=object))
+    frame.insert(1, "schools", s[:, 0].astype(np.int64))
+    frame.insert(2, "total", r["total"].astype(np.int64))
+    frame["simpson"] = r["simpson"]
+    frame["entropy"] = r["entropy"]
+    frame["theil"] = r["theil"]
+    frame["dissimilarity"] = r["dissimilarity"]
+    frame[MEAN_COLS] = means
+    return frame
+
+
+def _parent(table, level, parent, frame):
+    # Each group's parent label: the parent of its largest school (a few
+    # districts reach into a second county)
+    largest = table.sort_values("total", ascending=False, kind="stable")
+    first = largest.groupby(largest[level].astype(object), sort=False, observed=True)[parent].first()
+    return frame[level].map(first).astype(object).to_numpy()
+
+
+def _metro_rows(table, groups):
+    # Row positions and group codes of the schools in each metro group; a
+    # district may belong to more than one group
+    districts = table["District"].astype(object).map(normalize, na_action="ignore").to_numpy()
+    rows, codes = [np.zeros(0, dtype=np.intp)], [np.zeros(0, dtype=np.intp)]
+    for code, members in enumerate(groups.values()):
+        found = np.flatnonzero(np.isin(districts, [normalize(d) for d in members]))
+        rows.append(found)
+        codes.append(np.full(len(found), code, dtype=np.intp))
+    return np.concatenate(rows), np.concatenate(codes)
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+from data_cache import RACE_COLS
+
+# Grouping levels the menu scripts report on, from finest to coarsest
+LEVELS = ["District", "County"]
+
+
+def count_matrix(table, cols=RACE_COLS):
+    # schools x races, one contiguous int32 block the engine works on
+    return np.ascontiguousarray(table[cols].to_numpy(dtype=np.int32))
+
+
+def group_codes(labels):
+    # Labels -> 0..n-1 codes plus the label for each code. A missing label
+    # (blank County) becomes its own group rather than being dropped.
+    codes, names = pd.factorize(pd.Series(labels), sort=True, use_na_sentinel=False)
+    return codes.astype(np.intp), names
+
+
+def grouping(codes, n_groups):
+    # Sort order and run starts for codes, computed once and shared by every
+    # group_sum over the same labels
+    codes = np.asarray(codes)
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    if len(codes) == 0:
+        # No rows, no runs: every group sums to zero
+        return order, np.zeros(0, dtype=np.intp), sorted_codes, n_groups
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    return order, starts, sorted_codes[starts], n_groups
+
+
+def group_sum(values, groups):
+    # Sum the rows of values within each group in one reduceat pass
+    order, starts, present, n_groups = groups
+    out = np.zeros((n_groups,) + values.shape[1:], dtype=np.float64)
+    if len(order):
+        out[present] = np.add.reduceat(values[order], starts, axis=0)
+    return out
+
+
+def diversity(counts):
+    # Row-wise total, proportions, Simpson and Shannon entropy. Empty rows
+    # give nan proportions and metrics instead of a divide warning.
+    counts = np.asarray(counts, dtype=np.float64)
+    total = counts.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = counts / total[:, None]
+        plogp = np.where(p > 0, p * np.log(p), 0.0)
+    simpson = 1 - (p ** 2).sum(axis=1)
+    entropy = np.where(total > 0, -plogp.sum(axis=1), np.nan)
+    return total, p, simpson, entropy
+
+
+def group_indices(counts, codes, n_groups):
+    # Pooled diversity and between-school segregation for every group at once:
+    #   theil          multigroup information index H (0 = every school looks
+    #                  like its group, 1 = every school is one race)
+    #   dissimilarity  multigroup D, share of students who would have to move
+    #   exposure       [g, a, b] chance that a race-a student's schoolmate in
+    #                  group g is race b; the diagonal is isolation
+    c = np.asarray(counts, dtype=np.float64)
+    groups = grouping(codes, n_groups)
+    t, p, _, e = diversity(c)
+    p, e = np.nan_to_num(p), np.nan_to_num(e)
+    pooled = group_sum(c, groups)
+    total, P, simpson, entropy = diversity(pooled)
+
+    weighted_e = group_sum((t * e)[:, None], groups)[:, 0]
+    gap = (t * np.abs(p - P[codes]).sum(axis=1))[:, None]
+    spread = group_sum(gap, groups)[:, 0]
+    contact = group_sum(c[:, :, None] * p[:, None, :], groups)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        theil = 1 - weighted_e / (total * entropy)
+        dissimilarity = spread / (2 * total * simpson)
+        exposure = contact / pooled[:, :, None]
+    return {
+        "counts": pooled, "total": total, "p": P,
+        "simpson": simpson, "entropy": entropy,
+        "theil": theil, "dissimilarity": dissimilarity, "exposure": exposure,
+    }
+
+
+def segregation_indices(counts, groups):
+    # Every index for every level in one call. groups maps a level name to one
+    # label per school; "School" and "State" are always included.
+    t, p, simpson, entropy = diversity(counts)
+    result = {"School": {"counts": np.asarray(counts, dtype=np.float64), "total": t, "p": p,
+                         "simpson": simpson, "entropy": entropy}}
+    for level, labels in groups.items():
+        codes, names = group_codes(labels)
+        result[level] = dict(group_indices(counts, codes, len(names)), names=names)
+    state = np.zeros(len(counts), dtype=np.intp)
+    result["State"] = dict(group_indices(counts, state, 1), names=pd.Index(["STATE"]))
+    return result
+
+
+def _level_frame(level, r, races):
+    frame = pd.DataFrame(r["counts"].astype(np.int64), columns=races)
+    frame.insert(0, "total", r["total"].astype(np.int64))
+    for i, race in enumerate(races):
+        frame[f"p_{race}"] = r["p"][:, i]
+    frame["simpson"] = r["simpson"]
+    frame["entropy"] = r["entropy"]
+    if "theil" in r:
+        frame["theil"] = r["theil"]
+        frame["dissimilarity"] = r["dissimilarity"]
+        for a, ra in enumerate(races):
+            for b, rb in enumerate(races):
+                frame[f"{ra} to {rb}"] = r["exposure"][:, a, b]
+        frame.insert(0, level, r["names"])
+    return frame
+
+
+def segregation_tables(table, levels=LEVELS, races=RACE_COLS):
+    # segregation_indices over a per-school metrics table, one DataFrame per
+    # level. The School frame keeps the table's name/code columns.
+    r = segregation_indices(count_matrix(table, races),
+                            {level: table[level].to_numpy() for level in levels})
+    frames = {level: _level_frame(level, r[level], races) for level in r}
+    ids = [col for col in ["School Name", "District", "County", "District Code", "School Code"]
+           if col in table.columns]
+    frames["School"] = pd.concat([table[ids].reset_index(drop=True), frames["School"]], axis=1)
+    return frames
@@ -0,0 +1,195 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from metrics_table import KEY_COLS
+from name_index import normalize
+from segregation import count_matrix, diversity, group_sum, grouping
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # no scipy -> brute-force distances in blocks
+    cKDTree = None
+
+EARTH_RADIUS_KM = 6371.0
+
+# Column names accepted for coordinates, compared case-insensitively
+LAT_NAMES = ["latitude", "lat", "y"]
+LON_NAMES = ["longitude", "lon", "long", "lng", "x"]
+
+# Pairwise distances computed per block when there is no KD-tree
+BLOCK_CELLS = 4_000_000
+
+
+def _find_column(columns, names):
+    lower = {str(col).strip().lower(): col for col in columns}
+    for name in names:
+        if name in lower:
+            return lower[name]
+    raise ValueError(f"no coordinate column among {names}")
+
+
+def read_coordinates(path):
+    # School points from a CSV (a latitude and a longitude column) or a
+    # GeoJSON file of Point features. The other columns/properties identify
+    # the school: District Code + School Code, or School Name (+ District).
+    if os.path.splitext(path)[1].lower() in (".geojson", ".json"):
+        with open(path) as f:
+            features = json.load(f)["features"]
+        rows = []
+        for feature in features:
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") != "Point":
+                continue
+            lon, lat = geometry["coordinates"][:2]
+            rows.append({**(feature.get("properties") or {}), "Latitude": lat, "Longitude": lon})
+        coords = pd.DataFrame(rows)
+    else:
+        coords = pd.read_csv(path, dtype={"District Code": str})
+        coords = coords.rename(columns={_find_column(coords.columns, LAT_NAMES): "Latitude",
+                                        _find_column(coords.columns, LON_NAMES): "Longitude"})
+    coords["Latitude"] = pd.to_numeric(coords["Latitude"], errors="coerce")
+    coords["Longitude"] = pd.to_numeric(coords["Longitude"], errors="coerce")
+    return coords.dropna(subset=["Latitude", "Longitude"])
+
+
+def _join_keys(frame, cols):
+    keys = pd.DataFrame(index=frame.index)
+    for col in cols:
+        if col == "School Code":
+            keys[col] = pd.to_numeric(frame[col], errors="coerce").astype("Int64")
+        elif col == "District Code":
+            keys[col] = frame[col].astype(str).str.strip().str.upper()
+        else:
+            keys[col] = frame[col].astype(object).map(normalize, na_action="ignore")
+    return keys
+
+
+def attach_coordinates(table, coords):
+    # table plus Latitude/Longitude columns (nan where a school has no point).
+    # Schools are matched by code when the file has codes, by name otherwise.
+    # A name is only trusted when it picks out one school and one point:
+    # without District there are seven LINCOLN ES, so a name several schools
+    # share (or the file gives several points) is left unlocated.
+    if set(KEY_COLS) <= set(coords.columns):
+        cols = KEY_COLS
+    elif "School Name" in coords.columns:
+        cols = ["School Name", "District"] if "District" in coords.columns else ["School Name"]
+    else:
+        raise ValueError("coordinates need District Code + School Code or School Name columns")
+    points = _join_keys(coords, cols).assign(Latitude=coords["Latitude"], Longitude=coords["Longitude"])
+    keys = _join_keys(table, cols)
+    if cols == KEY_COLS:
+        points = points.drop_duplicates(subset=cols)
+        shared = np.zeros(len(table), dtype=bool)
+    else:
+        points = points.drop_duplicates()
+        points = points[~points.duplicated(subset=cols, keep=False)]
+        shared = keys.duplicated(keep=False).to_numpy()
+    located = keys.merge(points, on=cols, how="left")
+    out = table.copy()
+    out["Latitude"] = np.where(shared, np.nan, located["Latitude"].to_numpy(dtype=np.float64))
+    out["Longitude"] = np.where(shared, np.nan, located["Longitude"].to_numpy(dtype=np.float64))
+    return out
+
+
+def _unit_vectors(lat, lon):
+    # Points on the unit sphere: straight-line (chord) distance between them
+    # orders the same as great-circle distance, so a Euclidean KD-tree works
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _chord(radius_km):
+    return 2 * np.sin(radius_km / (2 * EARTH_RADIUS_KM))
+
+
+class SchoolLocator:
+    # Spatial index over school points, built once. Queries answer for every
+    # school at once and come back as CSR-style neighbor lists:
+    # neighbors[starts[i]:starts[i + 1]] are the positions near point i
+    # (never i itself).
+
+    def __init__(self, lat, lon):
+        self.points = _unit_vectors(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64))
+        self.tree = cKDTree(self.points) if cKDTree is not None else None
+
+    def __len__(self):
+        return len(self.points)
+
+    def _blocks(self):
+        n = len(self.points)
+        step = max(1, BLOCK_CELLS // max(n, 1))
+        for start in range(0, n, step):
+            rows = np.arange(start, min(start + step, n))
+            yield rows, self.points[rows] @ self.points.T
+
+    def within(self, radius_km):
+        n = len(self.points)
+        if self.tree is not None:
+            found = self.tree.query_ball_point(self.points, _chord(radius_km), return_sorted=True)
+            lists = [np.asarray(ids, dtype=np.intp) for ids in found]
+        else:
+            # chord <= c  <=>  dot >= 1 - c^2 / 2
+            min_dot = 1 - _chord(radius_km) ** 2 / 2
+            lists = []
+            for _, dots in self._blocks():
+                hits = dots >= min_dot
+                lists.extend(np.flatnonzero(hit) for hit in hits)
+        lists = [ids[ids != i] for i, ids in enumerate(lists)]
+        starts = np.zeros(n + 1, dtype=np.intp)
+        np.cumsum([len(ids) for ids in lists], out=starts[1:])
+        neighbors = np.concatenate(lists) if n else np.empty(0, dtype=np.intp)
+        return neighbors, starts
+
+    def nearest(self, k):
+        n = len(self.points)
+        k = min(k, n - 1)
+        if k <= 0:
+            return np.empty(0, dtype=np.intp), np.zeros(n + 1, dtype=np.intp)
+        if self.tree is not None:
+            _, ids = self.tree.query(self.points, k + 1)
+            ids = np.atleast_2d(ids)
+            # Drop each point itself; a twin at the same spot can come first,
+            # so where i is missing drop the farthest instead
+            drop = ids == np.arange(n)[:, None]
+            drop[~drop.any(axis=1), -1] = True
+            ids = ids[~drop].reshape(n, k)
+        else:
+            ids = np.empty((n, k), dtype=np.intp)
+            for rows, dots in self._blocks():
+                dots[np.arange(len(rows)), rows] = -np.inf
+                part = np.argpartition(-dots, k - 1, axis=1)[:, :k]
+                order = np.argsort(-np.take_along_axis(dots, part, axis=1), axis=1, kind="stable")
+                ids[rows] = np.take_along_axis(part, order, axis=1)
+        return ids.ravel(), np.arange(0, n * k + 1, k)
+
+
+def neighborhood_diversity(table, radius_km=None, k=None, locator=None):
+    # Every located school next to its neighborhood: the schools within
+    # radius_km, or its k nearest. area_* are the pooled Simpson/entropy of
+    # the neighbors (the school itself left out); simpson_gap < 0 means the
+    # school is less diverse than its surroundings.
+    if (radius_km is None) == (k is None):
+        raise ValueError("give exactly one of radius_km or k")
+    located = table[table["Latitude"].notna() & table["Longitude"].notna()]
+    if locator is None:
+        locator = SchoolLocator(located["Latitude"], located["Longitude"])
+    neighbors, starts = locator.within(radius_km) if k is None else locator.nearest(k)
+
+    counts = count_matrix(located)
+    sizes = np.diff(starts)
+    owner = np.repeat(np.arange(len(located)), sizes)
+    area = group_sum(counts[neighbors], grouping(owner, len(located)))
+    area_total, _, area_simpson, area_entropy = diversity(area)
+
+    out = located[["School Name", "District", "County"] + KEY_COLS + ["total", "simpson", "entropy"]].copy()
+    out["neighbors"] = sizes
+    out["area_total"] = area_total.astype(np.int64)
+    out["area_simpson"] = area_simpson
+    out["area_entropy"] = area_entropy
+    out["simpson_gap"] = out["simpson"] - area_simpson
+    out["entropy_gap"] = out["entropy"] - area_entropy
+    return out
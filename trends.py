@@ -0,0 +1,233 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from data_cache import RACE_COLS
+from ingest import ingest
+from name_index import normalize
+from segregation import diversity, group_codes, group_indices
+
+# Every release the trend engine knows about, oldest first
+RELEASES = ["OKC Metro.xlsx", "District Demographic Data.xlsx",
+            "School Totals by Ethnicity and GenderSY2024 1.xlsx",
+            "ORR ALL Grids Oct 1 2024 SY2025_Format.xlsx"]
+
+SCHOOL_METRICS = ["total", "simpson", "entropy"]
+# Between-school segregation inside a district, from that year's schools
+DISTRICT_METRICS = SCHOOL_METRICS + ["theil", "dissimilarity"]
+
+# Long school types -> the state grids' short form, so "Adams Elementary
+# School" (OKC Metro) lines up with "ADAMS ES"
+SCHOOL_TYPES = [
+    (r"\belementary( schools?)?\b|\belem\b", "es"),
+    (r"\bmiddle school\b", "ms"),
+    (r"\bhigh school\b", "hs"),
+    (r"\bj(unio)?r high( school)?\b", "jhs"),
+]
+
+
+def school_name_key(district, school):
+    # District + school name spelled one way, for matching across layouts:
+    # "Star-Spencer High School" and "STAR SPENCER HS" give the same key
+    name = re.sub(r"[^a-z0-9]+", " ", normalize(school))
+    for pattern, short in SCHOOL_TYPES:
+        name = re.sub(pattern, short, name)
+    return f"{normalize(district)}|{' '.join(name.split())}"
+
+
+def _code_key(district_codes, school_codes):
+    # "55I001:705", or missing when either code is
+    key = (district_codes.astype("string").str.strip().str.upper() + ":"
+           + school_codes.astype("string"))
+    return key.where(district_codes.notna() & school_codes.notna())
+
+
+def _slopes(x, y):
+    # Least-squares slope of every row of y against x, skipping nan cells;
+    # nan where a row has fewer than two points
+    mask = ~np.isnan(y)
+    n = mask.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = (mask * x).sum(axis=1) / n
+        y_mean = np.where(mask, y, 0).sum(axis=1) / n
+        dx = np.where(mask, x - x_mean[:, None], 0)
+        dy = np.where(mask, y - y_mean[:, None], 0)
+        slope = (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1)
+    return np.where(n >= 2, slope, np.nan)
+
+
+class Panel:
+    # Units (schools or districts) x years on aligned axes: counts[u, y, race]
+    # and every metric as a units x years array, nan where a unit has no
+    # data for a year. Deltas and trends are whole-array operations, so
+    # ranking every unit by change is one query.
+
+    def __init__(self, units, years, counts, extra=None):
+        self.units = units.reset_index(drop=True)
+        self.years = np.asarray(years)
+        self.counts = counts
+        n_units, n_years, n_races = counts.shape
+        total, _, simpson, entropy = diversity(counts.reshape(-1, n_races))
+        self.metrics = {"total": total, "simpson": simpson, "entropy": entropy}
+        self.metrics = {name: values.reshape(n_units, n_years) for name, values in self.metrics.items()}
+        self.metrics.update(extra or {})
+
+    def __len__(self):
+        return len(self.units)
+
+    def _year(self, year):
+        where = np.flatnonzero(self.years == year)
+        if not len(where):
+            raise KeyError(f"no data for {year}; years are {self.years.min()}-{self.years.max()}")
+        return where[0]
+
+    def metric(self, name):
+        return self.metrics[name]
+
+    def present(self):
+        # units x years, True where the unit has counts
+        return ~np.isnan(self.metrics["total"])
+
+    def deltas(self, start, end, metrics=None):
+        # Each metric at start and end and the change, for units in both years
+        metrics = list(self.metrics) if metrics is None else metrics
+        a, b = self._year(start), self._year(end)
+        out = self.units.copy()
+        for name in metrics:
+            values = self.metrics[name]
+            out[f"{name}_{start}"] = values[:, a]
+            out[f"{name}_{end}"] = values[:, b]
+            out[f"{name}_change"] = values[:, b] - values[:, a]
+        both = self.present()[:, [a, b]].all(axis=1)
+        return out[both]
+
+    def trends(self, metrics=None, min_years=2):
+        # Per-year least-squares slope of each metric over every year a unit
+        # has data; units seen in fewer than min_years years are left out
+        metrics = list(self.metrics) if metrics is None else metrics
+        x = self.years.astype(np.float64)[None, :]
+        out = self.units.copy()
+        out["years"] = self.present().sum(axis=1)
+        out["first_year"] = np.where(out["years"] > 0, self.years[self.present().argmax(axis=1)], -1)
+        for name in metrics:
+            out[f"{name}_slope"] = _slopes(x, self.metrics[name])
+        return out[out["years"] >= min_years]
+
+
+def _school_rows(data):
+    # One row per school and year with race counts and both match keys
+    rows = data[data["Unit"] == "school"].reset_index()
+    rows["code_key"] = _code_key(rows["District Code"], rows["School Code"])
+    rows["name_key"] = pd.Series([school_name_key(d, s) for d, s in zip(rows["District"], rows["School Name"])],
+                                 index=rows.index, dtype="string")
+    rows["key"] = rows["code_key"].fillna("name:" + rows["name_key"])
+    rows[RACE_COLS] = rows[RACE_COLS].fillna(0)
+    labels = ["County", "District", "District Code", "School Code", "School Name", "code_key", "name_key"]
+    g = rows.groupby(["School Year", "key"], sort=False)
+    out = g[labels].first().join(g[RACE_COLS].sum())
+    return out.reset_index()
+
+
+def _align(rows):
+    # Unit id of every (year, school) row: its codes, except that
+    #   - schools recoded between years (same district and name, codes
+    #     never present in the same year) share the most recent code
+    #   - rows without codes join the one coded school with their name
+    coded = rows[rows["code_key"].notna()]
+    alias = {}
+    for _, group in coded.groupby("name_key", sort=False):
+        ids = group.sort_values("School Year")["code_key"].unique()
+        if len(ids) > 1 and not group["School Year"].duplicated().any():
+            alias.update({i: ids[-1] for i in ids[:-1]})
+    unit = rows["code_key"].map(lambda key: alias.get(key, key), na_action="ignore")
+
+    owners = pd.Series(unit[coded.index].to_numpy(), index=coded["name_key"].to_numpy())
+    owners = owners.groupby(level=0).unique()
+    single = {name: ids[0] for name, ids in owners.items() if len(ids) == 1}
+    fallback = rows["name_key"].map(single)
+    return unit.fillna(fallback).fillna("name:" + rows["name_key"])
+
+
+def _pivot(rows, unit_ids, years):
+    # rows -> counts[unit, year, race], nan where a unit has no row that year
+    units, unit_names = group_codes(unit_ids.to_numpy())
+    year_pos = np.searchsorted(years, rows["School Year"].to_numpy())
+    counts = np.zeros((len(unit_names), len(years), len(RACE_COLS)))
+    seen = np.zeros((len(unit_names), len(years)), dtype=bool)
+    values = rows[RACE_COLS].to_numpy(dtype=np.float64, na_value=np.nan)
+    np.add.at(counts, (units, year_pos), values)
+    seen[units, year_pos] = True
+    counts[~seen] = np.nan
+    return units, unit_names, counts
+
+
+def _latest_labels(rows, units, cols):
+    # Each unit described by its most recent row
+    latest = rows.assign(_unit=units).sort_values("School Year", kind="stable")
+    return latest.groupby("_unit")[cols].last()
+
+
+def school_panel(data):
+    # Schools aligned across every release in an ingest() dataset
+    rows = _school_rows(data)
+    years = np.sort(rows["School Year"].unique())
+    unit_ids = _align(rows)
+    units, unit_names, counts = _pivot(rows, unit_ids, years)
+    labels = _latest_labels(rows, units, ["School Name", "District", "County", "District Code", "School Code"])
+    labels.insert(0, "unit", np.asarray(unit_names))
+    return Panel(labels, years, counts)
+
+
+def _district_key(rows):
+    # District Code where known; districts only ever seen by name (OKC
+    # Metro) borrow the code another release uses for that name
+    codes = rows["District Code"].astype("string").str.strip().str.upper()
+    names = rows["District"].map(normalize, na_action="ignore")
+    by_name = pd.Series(codes[codes.notna()].to_numpy(), index=names[codes.notna()].to_numpy())
+    by_name = by_name[~by_name.index.duplicated()]
+    return codes.fillna(names.map(by_name)).fillna("name:" + names)
+
+
+def district_panel(data):
+    # Districts across every release: counts summed from that year's
+    # schools, replaced by district-level counts (District Demographic Data)
+    # where a release has them. Theil and dissimilarity between a district's
+    # schools come from the school rows of each year.
+    schools = _school_rows(data)
+    schools["unit"] = _district_key(schools)
+    districts = data[data["Unit"] == "district"].reset_index()
+    districts["unit"] = _district_key(districts)
+    districts = districts.drop_duplicates(subset=["School Year", "unit"], keep="last")
+
+    school_sums = schools.groupby(["School Year", "unit"], sort=False)[RACE_COLS].sum().reset_index()
+    reported = pd.MultiIndex.from_frame(districts[["School Year", "unit"]])
+    keep = ~pd.MultiIndex.from_frame(school_sums[["School Year", "unit"]]).isin(reported)
+    rows = pd.concat([school_sums[keep], districts[["School Year", "unit"] + RACE_COLS]], ignore_index=True)
+
+    years = np.sort(rows["School Year"].unique())
+    units, unit_names, counts = _pivot(rows, rows["unit"], years)
+    lookup = {name: i for i, name in enumerate(unit_names)}
+
+    extra = {name: np.full((len(unit_names), len(years)), np.nan) for name in ["theil", "dissimilarity"]}
+    for year, group in schools.groupby("School Year"):
+        codes = group["unit"].map(lookup).to_numpy()
+        r = group_indices(group[RACE_COLS].to_numpy(dtype=np.float64), codes, len(unit_names))
+        y = np.searchsorted(years, year)
+        present = np.unique(codes)
+        for name in extra:
+            extra[name][present, y] = r[name][present]
+
+    labels_from = pd.concat([schools[["School Year", "unit", "District", "County", "District Code"]],
+                             districts[["School Year", "unit", "District", "County", "District Code"]]],
+                            ignore_index=True)
+    labels = _latest_labels(labels_from, labels_from["unit"].map(lookup).to_numpy(),
+                            ["District", "County", "District Code"])
+    labels.insert(0, "unit", np.asarray(unit_names))
+    return Panel(labels, years, counts, extra)
+
+
+def load_panels(releases=RELEASES, max_workers=None):
+    # (schools, districts) panels of every release
+    data = ingest(list(releases), max_workers)
+    return school_panel(data), district_panel(data)
@@ -0,0 +1,69 @@
+import numpy as np
+
+from segregation import count_matrix, diversity
+
+DRAWS = 1000
+CONFIDENCE = 0.95
+
+# Pseudo-count added to every race before resampling (Jeffreys prior).
+# Without it a race a small school has no students of can never be drawn,
+# and a 6-student single-race school gets a zero-width interval.
+PRIOR = 0.5
+
+# Resampled counts held at once (draws x schools x races)
+CHUNK_CELLS = 4_000_000
+
+# Fixed so repeated runs rank schools the same way
+SEED = 0
+
+INTERVAL_COLS = [f"{metric}_{stat}" for metric in ["simpson", "entropy"] for stat in ["low", "high", "se"]]
+
+
+def bootstrap_samples(counts, draws=DRAWS, prior=PRIOR, seed=SEED):
+    # Simpson and entropy of draws multinomial resamples of every school at
+    # once, as two draws x schools arrays. Each resample keeps the school's
+    # enrollment and draws races from its smoothed proportions.
+    counts = np.asarray(counts, dtype=np.float64)
+    n_schools, n_races = counts.shape
+    total = counts.sum(axis=1)
+    pvals = (counts + prior) / (total + n_races * prior)[:, None]
+    n = total.astype(np.int64)
+
+    rng = np.random.default_rng(seed)
+    simpson = np.empty((draws, n_schools))
+    entropy = np.empty((draws, n_schools))
+    step = max(1, CHUNK_CELLS // max(n_schools * n_races, 1))
+    for start in range(0, draws, step):
+        stop = min(start + step, draws)
+        sample = rng.multinomial(n, pvals, size=(stop - start, n_schools))
+        _, _, s, e = diversity(sample.reshape(-1, n_races))
+        simpson[start:stop] = s.reshape(stop - start, n_schools)
+        entropy[start:stop] = e.reshape(stop - start, n_schools)
+    return simpson, entropy
+
+
+def bootstrap_intervals(counts, draws=DRAWS, confidence=CONFIDENCE, prior=PRIOR, seed=SEED):
+    # Percentile intervals and standard errors per school:
+    # {"simpson_low", "simpson_high", "simpson_se", "entropy_low", ...}
+    tail = (1 - confidence) / 2
+    out = {}
+    for name, samples in zip(["simpson", "entropy"], bootstrap_samples(counts, draws, prior, seed)):
+        low, high = np.quantile(samples, [tail, 1 - tail], axis=0)
+        out[f"{name}_low"] = low
+        out[f"{name}_high"] = high
+        out[f"{name}_se"] = samples.std(axis=0, ddof=1)
+    return out
+
+
+def with_intervals(table, draws=DRAWS, confidence=CONFIDENCE, prior=PRIOR, seed=SEED):
+    # Copy of a school table with the bootstrap columns added. Ranking on
+    # simpson_low (highest first) or simpson_high (lowest first) lets small
+    # schools in only as far as their counts support, instead of dropping
+    # them below a fixed enrollment.
+    out = table.copy()
+    intervals = bootstrap_intervals(count_matrix(table), draws, confidence, prior, seed)
+    empty = out["total"].to_numpy() <= 0
+    for col in INTERVAL_COLS:
+        # A school with no students has nothing to resample
+        out[col] = np.where(empty, np.nan, intervals[col])
+    return out
@@ -0,0 +1,77 @@
+import numpy as np
+
+from metric_registry import MetricView
+from profiling import timed
+
+# Schools below this enrollment are left out of rankings and averages
+MIN_TOTAL = 70
+
+
+class SchoolViews:
+    # Filters and rankings over one school table, worked out once and reused
+    # by every menu action. Rows are addressed by position (iloc), and the
+    # frames handed back are shared: copy one before changing it. Rankings
+    # take any metric_registry metric; one not stored in the table is
+    # computed for the filtered schools only, the first time it is ranked.
+
+    def __init__(self, table):
+        self.table = table
+        names = table["School Name"]
+        self.not_epic = ~names.str.contains("Epic", case=False, na=False).to_numpy(dtype=bool)
+        self._total = table["total"].to_numpy()
+        self._masks = {}
+        self._frames = {}
+        self._metrics = {}
+        self._ranked = {}
+
+    def mask(self, min_total=MIN_TOTAL):
+        # Non-Epic schools above min_total
+        if min_total not in self._masks:
+            self._masks[min_total] = self.not_epic & (self._total > min_total)
+        return self._masks[min_total]
+
+    @timed("filter")
+    def filter(self, rows=None, min_total=MIN_TOTAL):
+        # The filtered table, or just the filtered part of rows
+        if rows is None:
+            if min_total not in self._frames:
+                self._frames[min_total] = self.table[self.mask(min_total)]
+            return self._frames[min_total]
+        rows = np.asarray(rows)
+        return self.table.iloc[rows[self.mask(min_total)[rows]]]
+
+    def metrics(self, min_total=MIN_TOTAL):
+        # Lazy metrics of the filtered schools (a metric_registry.MetricView)
+        if min_total not in self._metrics:
+            self._metrics[min_total] = MetricView(self.table, np.flatnonzero(self.mask(min_total)))
+        return self._metrics[min_total]
+
+    def ranked(self, metric, min_total=MIN_TOTAL, ascending=False):
+        # Positions of the filtered schools, highest metric first (lowest
+        # with ascending); missing values last either way
+        key = (metric, min_total, ascending)
+        if key not in self._ranked:
+            view = self.metrics(min_total)
+            values = view[metric] if ascending else -view[metric]
+            order = np.argsort(np.nan_to_num(values, nan=np.inf), kind="stable")
+            self._ranked[key] = view.rows[order]
+        return self._ranked[key]
+
+    def _with_metric(self, positions, metric, min_total):
+        # table rows at positions, with the metric as a column if the table
+        # doesn't store it
+        frame = self.table.iloc[positions]
+        if metric in frame.columns:
+            return frame
+        view = self.metrics(min_total)
+        values = view[metric][np.searchsorted(view.rows, positions)]
+        return frame.assign(**{metric: values})
+
+    @timed("rank/top")
+    def top(self, metric, k, min_total=MIN_TOTAL):
+        return self._with_metric(self.ranked(metric, min_total)[:k], metric, min_total)
+
+    @timed("rank/bottom")
+    def bottom(self, metric, k, min_total=MIN_TOTAL):
+        # Lowest first
+        return self._with_metric(self.ranked(metric, min_total, ascending=True)[:k], metric, min_total)